@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+
+if __package__ in (None, ''):
+    # Run as a script: make the src directory importable so the parser package resolves.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from benchmark.synthetic_reference import generate_reference, write_reference
+from parser.parser_audience import load_excel, run_forecast
+from utilities.instrumentation import instrumentation
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_WORKDIR = os.path.join(tempfile.gettempdir(), 'audience_benchmark')
+REPORT_FILE_NAME = 'benchmark_report.json'
+
+
+class StageRecorder:
+    """
+    Accumulates the wall time and peak traced memory of each pipeline stage.
+
+    An instance can be passed as the parser progress callback: every reported stage closes the previous one.
+    Repeated reports of a stage, such as 'write' every WRITE_PROGRESS_ROWS rows, add up.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.current = None
+        self.started = None
+
+    def __call__(self, stage):
+        self.start(stage)
+
+    def start(self, stage):
+        self.stop()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self.current = stage
+        self.started = perf_counter()
+
+    def stop(self):
+        if self.current is None:
+            return
+        elapsed = perf_counter() - self.started
+        entry = self.stages.setdefault(self.current, {'seconds': 0.0, 'peak_bytes': None})
+        entry['seconds'] += elapsed
+        if self.trace_memory:
+            entry['peak_bytes'] = max(entry['peak_bytes'] or 0, tracemalloc.get_traced_memory()[1])
+        self.current = None
+
+
+def reference_file(rows, workdir, options):
+    """Returns the synthetic reference workbook for rows, generating it only when it is not already on disk."""
+    name = (f"reference_{rows}_p{options.products}_c{options.channels or 'auto'}_d{options.duplicate_rate}"
+            f"_s{options.seed}.xlsx")
+    file_path = os.path.join(workdir, name)
+    if not os.path.exists(file_path):
+        print(f"Generating {file_path}...")
+        df = generate_reference(rows, years=(options.references_year - 1, options.references_year),
+                                products=options.products, channels=options.channels,
+                                duplicate_rate=options.duplicate_rate, seed=options.seed)
+        write_reference(df, file_path)
+    return file_path
+
+
+def run_size(rows, workdir, options):
+    """Runs the load and forecast pipeline on a reference of rows rows and returns its measurements."""
+    file_path = reference_file(rows, workdir, options)
+    output_dir = os.path.join(workdir, f"output_{rows}")
+    params = {
+        'references_month': options.references_month,
+        'references_year': options.references_year,
+        'target_start_year': options.references_year + 1,
+        'target_end_year': options.references_year + options.target_years,
+        'output_dir': output_dir,
+        'file_path': file_path,
+    }
+
+    recorder = StageRecorder(trace_memory=not options.skip_memory)
+    if recorder.trace_memory:
+        tracemalloc.start()
+    started = perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            recorder.start('load')
+            df = load_excel(file_path, options.references_month, options.references_year)
+            result = run_forecast(df, params, progress=recorder)
+            recorder.stop()
+    finally:
+        if recorder.trace_memory:
+            tracemalloc.stop()
+
+    output_file = result['output_file']
+    return {
+        'rows': rows,
+        'file_bytes': os.path.getsize(file_path),
+        'reference_rows': len(result['reference_df']),
+        'forecast_rows': len(result['forecast_df']),
+        'duplicate_keys': result['duplicates']['duplicate_keys'] if result['duplicates'] else 0,
+        'output_bytes': os.path.getsize(output_file) if output_file else None,
+        'total_seconds': perf_counter() - started,
+        'stages': recorder.stages,
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'openpyxl': openpyxl.__version__,
+    }
+
+
+def print_run(run, baseline=None):
+    print(f"{run['rows']} rows: {run['total_seconds']:.2f}s total, {run['forecast_rows']} forecast rows")
+    for stage, entry in run['stages'].items():
+        line = f"  {stage:<10} {entry['seconds']:9.3f}s"
+        if entry['peak_bytes'] is not None:
+            line += f"  peak {entry['peak_bytes'] / 2 ** 20:9.1f} MB"
+        previous = (baseline or {}).get(stage)
+        if previous and previous['seconds']:
+            line += f"  x{entry['seconds'] / previous['seconds']:.2f} vs baseline"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the audience forecast pipeline on synthetic references.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Reference row counts.")
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR, help="Where references and outputs are written.")
+    parser.add_argument('--report', help=f"Report path, {REPORT_FILE_NAME} in the workdir by default.")
+    parser.add_argument('--compare', help="A previous report to print per-stage time ratios against.")
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--channels', type=int, help="By default just enough for unique keys.")
+    parser.add_argument('--duplicate-rate', type=float, default=0.0)
+    parser.add_argument('--references-month', type=int, default=6)
+    parser.add_argument('--references-year', type=int, default=2024)
+    parser.add_argument('--target-years', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-memory', action='store_true',
+                        help="Do not trace memory; tracemalloc slows the stages down.")
+    parser.add_argument('--events', help="JSON-lines file receiving the instrumentation stage events.")
+    parser.add_argument('--profile-dir', help="Directory receiving a cProfile dump of every instrumented stage.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    os.makedirs(options.workdir, exist_ok=True)
+    instrumentation.configure(events_path=options.events, profile_dir=options.profile_dir)
+
+    baselines = {}
+    if options.compare:
+        with open(options.compare, 'r') as file:
+            baselines = {run['rows']: run['stages'] for run in json.load(file)['runs']}
+
+    runs = []
+    for rows in options.sizes:
+        run = run_size(rows, options.workdir, options)
+        print_run(run, baselines.get(rows))
+        runs.append(run)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'options': vars(options),
+        'runs': runs,
+    }
+    report_path = options.report or os.path.join(options.workdir, REPORT_FILE_NAME)
+    with open(report_path, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
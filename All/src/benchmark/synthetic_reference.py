@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from parser.parser_audience import KEY_COLUMNS, VIEWING_MINUTES_COLUMNS
+
+REFERENCE_COLUMNS = KEY_COLUMNS + ['sum_eop_vol_2024', 'sum_eop_vol_2025'] + VIEWING_MINUTES_COLUMNS
+MONTHS = 12
+
+
+def generate_reference(rows, years=(2023, 2024), products=50, channels=None, duplicate_rate=0.0, zero_eop_rate=0.02,
+                       seed=0):
+    """
+    Builds a reference DataFrame shaped like the audience exports.
+
+    Keys are drawn without replacement from years x months x products x channels, so every key is unique unless
+    duplicate_rate asks for some rows to repeat the key of another row.
+
+    Args:
+        rows (int): Number of rows.
+        years (tuple): The PERIOD_YEAR values.
+        products (int): Number of distinct PROD_NUM values.
+        channels (int, optional): Number of distinct BUS_CHANL_NUM values; by default just enough for rows unique keys.
+        duplicate_rate (float): Share of rows whose key duplicates another row's key.
+        zero_eop_rate (float): Share of rows with a 0 sum_eop_vol_2024, which the forecast leaves unscaled.
+        seed (int): Seed of the random generator, so runs are reproducible.
+
+    Returns:
+        pd.DataFrame: The reference rows, sorted by period, product and channel like the exports.
+    """
+    rng = np.random.default_rng(seed)
+    years = np.asarray(years)
+    if channels is None:
+        channels = max(1, -(-rows // (len(years) * MONTHS * products)))
+    key_space = len(years) * MONTHS * products * channels
+    if rows > key_space:
+        raise ValueError(f"{rows} rows do not fit in {key_space} distinct keys; raise products or channels.")
+
+    keys = rng.choice(key_space, size=rows, replace=False)
+    duplicates = int(rows * duplicate_rate)
+    if duplicates:
+        keys[rng.choice(rows, size=duplicates, replace=False)] = keys[rng.choice(rows, size=duplicates)]
+    keys.sort()
+
+    keys, channel = np.divmod(keys, channels)
+    keys, product = np.divmod(keys, products)
+    year, month = np.divmod(keys, MONTHS)
+
+    eop_2024 = rng.integers(1, 5000, size=rows).astype(float)
+    eop_2024[rng.random(rows) < zero_eop_rate] = 0
+    df = pd.DataFrame({
+        'PERIOD_YEAR': years[year],
+        'PERIOD_MONTH': month + 1,
+        'PROD_NUM': product + 1000,
+        'BUS_CHANL_NUM': channel + 1,
+        'sum_eop_vol_2024': eop_2024,
+        'sum_eop_vol_2025': np.round(eop_2024 * rng.uniform(0.8, 1.2, size=rows)),
+    })
+    for col in VIEWING_MINUTES_COLUMNS:
+        df[col] = np.round(rng.gamma(2.0, 500.0, size=rows), 2)
+    return df[REFERENCE_COLUMNS]
+
+
+def write_reference(df, file_path):
+    """Writes df as a plain single-sheet workbook, the way the reference exports come in."""
+    workbook = Workbook(write_only=True)
+    ws = workbook.create_sheet(title="Sheet1")
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        ws.append(list(row))
+    workbook.save(file_path)
+    return file_path
@@ -7,6 +7,8 @@ from ui.tab_cost import CostTab
 from ui.ui_config import ConfigUI
 from utilities.utils import show_message, create_styled_button, prevent_multiple_instances, get_base_dir, center_window
 from utilities.config_manager import ConfigManager, ConfigLoaderPopup
+from utilities.excel_cache import excel_cache
+from utilities.instrumentation import instrumentation
 import os
 
 
@@ -18,6 +20,8 @@ class MainApplication(tk.Tk):
         self.base_dir = base_dir
         self.config_manager = ConfigManager()
         self.config_data = self.config_manager.load_config()
+        excel_cache.enable_sidecar(os.path.join(os.path.dirname(self.config_manager.config_file), 'cache'))
+        instrumentation.configure_from_env()
         self.config_ui_callback = self.update_config_data
 
         self.initialize_ui()
@@ -44,6 +48,7 @@ class MainApplication(tk.Tk):
         self.create_menus()
         self.create_tabs()
         self.create_bottom_frame()
+        self.protocol("WM_DELETE_WINDOW", self.exit_app)
 
     def configure_geometry(self):
         """Configure window size and properties."""
@@ -156,6 +161,9 @@ class MainApplication(tk.Tk):
         update_deal_button = create_styled_button(cost_frame, "Update Deal", self.cost_tab.open_update_deal_popup, width=12)
         update_deal_button.pack(side='left', padx=5, pady=5)
 
+        save_deals_button = create_styled_button(cost_frame, "Save", self.cost_tab.flush_edits, width=12)
+        save_deals_button.pack(side='left', padx=5, pady=5)
+
 
 
     def open_config(self):
@@ -175,6 +183,8 @@ class MainApplication(tk.Tk):
             show_message("Error", "Failed to save configuration:\n" + str(e), type="error", master=self, custom=True)
 
     def exit_app(self):
+        if self.cost_tab is not None:
+            self.cost_tab.flush_edits()
         self.quit()
 
     def edit_undo(self):
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from parser.key_codes import normalize_keys
+from parser.parser_audience import (KEY_COLUMNS, DEFAULT_OUTPUT_FORMAT, FORECAST_FILE_NAME, forecast_reference,
+                                    save_forecast, select_reference_data)
+from parser.ratio_index import RatioIndex
+from parser.reference_reader import concat_chunks, iter_reference_chunks, reference_window_filter
+from parser.validation import find_duplicate_keys, format_duplicate_report
+
+SCENARIO_DEFAULTS = {
+    'references_month': 6,
+    'references_year': 2024,
+    'target_start_year': 2025,
+    'target_end_year': 2025,
+    'specifics_enabled': False,
+    'prod_nums': [],
+    'bus_chanl_nums': [],
+    'output_format': DEFAULT_OUTPUT_FORMAT,
+}
+
+
+def load_scenarios(scenario_file):
+    """
+    Reads a batch definition from a JSON file.
+
+    The file holds an object with a 'scenarios' list; every other top-level key (file_path, output_dir, workers,
+    or any scenario parameter) is a default shared by all scenarios.
+    """
+    with open(scenario_file, 'r') as file:
+        return json.load(file)
+
+
+def file_safe_name(value):
+    """Reduces value to letters, digits, '_' and '-' so it can be part of a file name."""
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', str(value)).strip('_')
+
+
+def expand_scenarios(batch):
+    """Returns the batch scenarios with the shared defaults filled in and a unique, file-safe name."""
+    shared = {key: value for key, value in batch.items() if key != 'scenarios'}
+    scenarios = []
+    used_names = set()
+    for idx, scenario in enumerate(batch.get('scenarios', []), 1):
+        merged = dict(SCENARIO_DEFAULTS)
+        merged.update(shared)
+        merged.update(scenario)
+        name = file_safe_name(merged.get('name') or f"scenario_{idx}")
+        if not name or name in used_names:
+            name = f"{name or 'scenario'}_{idx}"
+        used_names.add(name)
+        merged['name'] = name
+        scenarios.append(merged)
+    return scenarios
+
+
+def load_batch_reference(file_path, scenarios):
+    """Reads the reference file once, keeping only the rows of at least one scenario's reference window."""
+    windows = {(int(scenario['references_month']), int(scenario['references_year'])) for scenario in scenarios}
+    filters = [reference_window_filter(month, year) for month, year in windows]
+
+    def keep(year, month):
+        return any(row_filter(year, month) for row_filter in filters)
+
+    return normalize_keys(concat_chunks(iter_reference_chunks(file_path, row_filter=keep)))
+
+
+def write_scenario(forecast_df, reference_df, output_dir, file_path, references_year, prod_nums, bus_chanl_nums,
+                   file_name, output_format=DEFAULT_OUTPUT_FORMAT):
+    return save_forecast(forecast_df, reference_df, output_dir, file_path, references_year, prod_nums,
+                         bus_chanl_nums, file_name=file_name, output_format=output_format)
+
+
+def run_batch(batch, workers=None):
+    """
+    Forecasts every scenario of a batch from a single read of the reference file.
+
+    The eop ratio index is built once for all the loaded rows and shared by the scenarios; each scenario is then
+    forecast in-process and its workbook, the expensive part, is written by a process pool to
+    forecast_audience_<name>.xlsx.
+
+    Args:
+        batch (dict): A batch definition, as returned by load_scenarios.
+        workers (int, optional): Number of writer processes; defaults to the batch 'workers' key, then to the
+            number of scenarios capped by the CPU count.
+
+    Returns:
+        list: One dict per scenario with its 'name', 'output_file', 'rows' and 'duplicates' report.
+    """
+    scenarios = expand_scenarios(batch)
+    if not scenarios:
+        logging.error("The batch does not define any scenario.")
+        return []
+
+    file_path = batch.get('file_path')
+    if not file_path or not os.path.exists(file_path):
+        logging.error(f"The specified file does not exist: {file_path}")
+        return []
+
+    df = load_batch_reference(file_path, scenarios)
+    print(f"Reference rows loaded for {len(scenarios)} scenarios: {len(df)}")
+    ratio_index = RatioIndex(df, KEY_COLUMNS)
+
+    results = []
+    jobs = []
+    for scenario in scenarios:
+        result = {'name': scenario['name'], 'output_file': None, 'rows': 0, 'duplicates': None}
+        results.append(result)
+        if not scenario.get('output_dir'):
+            logging.error(f"Scenario {scenario['name']}: no output directory specified.")
+            continue
+        reference_df = select_reference_data(df, int(scenario['references_month']),
+                                             int(scenario['references_year']), scenario['specifics_enabled'],
+                                             scenario['prod_nums'], scenario['bus_chanl_nums'])
+        duplicates = find_duplicate_keys(reference_df, KEY_COLUMNS)
+        if duplicates is not None:
+            logging.error(f"Scenario {scenario['name']}: {format_duplicate_report(duplicates)}")
+            result['duplicates'] = duplicates
+            continue
+
+        forecast_df = forecast_reference(reference_df, int(scenario['target_start_year']),
+                                         int(scenario['target_end_year']), ratio_index)
+        result['rows'] = len(forecast_df)
+        if forecast_df.empty:
+            continue
+
+        file_name = f"{os.path.splitext(FORECAST_FILE_NAME)[0]}_{scenario['name']}.xlsx"
+        jobs.append((result, (forecast_df, reference_df, scenario.get('output_dir'), file_path,
+                              int(scenario['references_year']), scenario['prod_nums'], scenario['bus_chanl_nums'],
+                              file_name, scenario['output_format'])))
+
+    if workers is None:
+        workers = batch.get('workers') or min(len(jobs), os.cpu_count() or 1)
+    workers = max(1, int(workers))
+
+    if workers == 1 or len(jobs) <= 1:
+        for result, job in jobs:
+            result['output_file'] = write_scenario(*job)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [(result, executor.submit(write_scenario, *job)) for result, job in jobs]
+        for result, future in futures:
+            result['output_file'] = future.result()
+    return results
@@ -0,0 +1,169 @@
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+if __package__ in (None, ''):
+    # Run as a script: make the src directory importable so the parser package resolves.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parser.batch_forecast import file_safe_name, load_scenarios, run_batch
+from parser.parser_audience import DEFAULT_OUTPUT_FORMAT, FORECAST_FILE_NAME, OUTPUT_FORMATS, load_excel, run_forecast
+from utilities.instrumentation import instrumentation
+
+
+def expand_reference_paths(patterns):
+    """Expands the --ref arguments, literal paths or glob patterns, into an ordered list of distinct files."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logging.warning(f"No reference file matches {pattern}")
+        for path in matches:
+            path = os.path.normpath(path)
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def output_file_names(paths):
+    """FORECAST_FILE_NAME for a single reference, forecast_audience_<reference name>.xlsx for several."""
+    if len(paths) == 1:
+        return [FORECAST_FILE_NAME]
+    stem = os.path.splitext(FORECAST_FILE_NAME)[0]
+    names = []
+    used = set()
+    for path in paths:
+        name = file_safe_name(os.path.splitext(os.path.basename(path))[0]) or 'reference'
+        unique = name
+        suffix = 2
+        while unique in used:
+            unique = f"{name}_{suffix}"
+            suffix += 1
+        used.add(unique)
+        names.append(f"{stem}_{unique}.xlsx")
+    return names
+
+
+def forecast_file(file_path, params):
+    """
+    Loads one reference file and writes its forecast workbook.
+
+    Returns a summary rather than the DataFrames, so results come back from worker processes cheaply.
+    """
+    started = time.perf_counter()
+    summary = {'file_path': file_path, 'output_file': None, 'reference_rows': 0, 'forecast_rows': 0,
+               'duplicates': None, 'error': None}
+    try:
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"The specified file does not exist: {file_path}")
+        df = load_excel(file_path, params['references_month'], params['references_year'])
+        result = run_forecast(df, dict(params, file_path=file_path))
+        summary.update(output_file=result['output_file'], reference_rows=len(result['reference_df']),
+                       forecast_rows=len(result['forecast_df']), duplicates=result['duplicates'])
+    except Exception as e:
+        logging.error(f"{file_path}: {e}")
+        summary['error'] = str(e)
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def configure_worker():
+    """Process pool initializer: spawned workers do not inherit the instrumentation configured in the parent."""
+    if not instrumentation.is_active():
+        instrumentation.configure_from_env()
+
+
+def run_references(paths, params, workers=None):
+    """
+    Forecasts every reference file with the same parameters, in a process pool when there are several.
+
+    Returns:
+        list: The forecast_file summaries, in the order of paths.
+    """
+    jobs = [(path, dict(params, file_name=name)) for path, name in zip(paths, output_file_names(paths))]
+    if workers is None:
+        workers = min(len(jobs), os.cpu_count() or 1)
+    workers = max(1, int(workers))
+
+    if workers == 1 or len(jobs) <= 1:
+        return [forecast_file(path, job_params) for path, job_params in jobs]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_worker) as executor:
+        futures = [executor.submit(forecast_file, path, job_params) for path, job_params in jobs]
+        return [future.result() for future in futures]
+
+
+def command_run(options):
+    paths = expand_reference_paths(options.ref)
+    if not paths:
+        logging.error("No reference file to forecast.")
+        return 1
+
+    params = {
+        'references_month': options.ref_month,
+        'references_year': options.ref_year,
+        'target_start_year': options.target_start,
+        'target_end_year': options.target_end,
+        'specifics_enabled': bool(options.prod or options.channel),
+        'prod_nums': options.prod or [],
+        'bus_chanl_nums': options.channel or [],
+        'output_dir': options.out,
+        'output_format': options.format,
+    }
+    failed = 0
+    for summary in run_references(paths, params, options.workers):
+        if summary['output_file'] is None:
+            failed += 1
+            reason = summary['error'] or ("duplicate reference keys" if summary['duplicates'] else "nothing written")
+            logging.error(f"{summary['file_path']}: no forecast written ({reason})")
+        else:
+            logging.info(f"{summary['file_path']}: {summary['forecast_rows']} forecast rows -> "
+                         f"{summary['output_file']} in {summary['seconds']:.1f}s")
+    return 1 if failed else 0
+
+
+def command_batch(options):
+    results = run_batch(load_scenarios(options.scenario_file), options.workers)
+    for result in results:
+        logging.info(f"Scenario {result['name']}: {result['rows']} rows -> {result['output_file']}")
+    return 0 if results and all(result['output_file'] for result in results) else 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='forecast', description="Headless audience forecast.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="Forecast one or more reference files with the same parameters.")
+    run.add_argument('--ref', action='append', required=True,
+                     help="Reference Excel file or glob pattern; may be repeated.")
+    run.add_argument('--ref-month', type=int, default=6)
+    run.add_argument('--ref-year', type=int, default=2024)
+    run.add_argument('--target-start', type=int, default=2025)
+    run.add_argument('--target-end', type=int, default=2025)
+    run.add_argument('--prod', action='append', help="PROD_NUM to keep; may be repeated.")
+    run.add_argument('--channel', action='append', help="BUS_CHANL_NUM to keep; may be repeated.")
+    run.add_argument('--out', required=True, help="Output directory, created when missing.")
+    run.add_argument('--format', choices=list(OUTPUT_FORMATS), default=DEFAULT_OUTPUT_FORMAT,
+                     help="styled or plain xlsx, csv, or parquet (needs pyarrow or fastparquet).")
+    run.add_argument('--workers', type=int, help="Worker processes; by default one per file, capped by the CPUs.")
+    run.set_defaults(handler=command_run)
+
+    batch = commands.add_parser('batch', help="Forecast the scenarios of a JSON batch file.")
+    batch.add_argument('scenario_file')
+    batch.add_argument('--workers', type=int)
+    batch.set_defaults(handler=command_batch)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    instrumentation.configure_from_env()
+    return options.handler(options)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
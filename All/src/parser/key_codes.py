@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_KEY_COLUMNS = ['PROD_NUM', 'BUS_CHANL_NUM']
+
+
+def normalize_keys(df, columns=None):
+    """
+    Returns df with the key columns stored as categoricals, converting each column only once.
+
+    Category values keep their original type, so written outputs are unchanged; filtering and grouping then run
+    on the integer codes. The input frame is not modified.
+    """
+    if columns is None:
+        columns = CATEGORICAL_KEY_COLUMNS
+    to_convert = [col for col in columns if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not to_convert:
+        return df
+
+    df = df.copy(deep=False)
+    for col in to_convert:
+        values = df[col].astype('category')
+        df[col] = values.cat.reorder_categories(sorted(values.cat.categories, key=str))
+    return df
+
+
+def key_labels(series, dropna=False):
+    """
+    Sorted string labels of the key values present in the series, as str() shows them in the listboxes.
+
+    Missing keys are labelled 'nan', like astype(str) does, unless dropna is set.
+    """
+    series = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    codes = np.unique(series.cat.codes.to_numpy())
+    categories = series.cat.categories
+    labels = {str(categories[code]) for code in codes if code >= 0}
+    if not dropna and codes.size and codes[0] < 0:
+        labels.add('nan')
+    return sorted(labels)
+
+
+def key_mask(series, selected):
+    """
+    Boolean mask of the rows whose key, as a string, is in selected; equivalent to series.astype(str).isin(selected).
+
+    Only the categories are converted to strings; rows are matched through their integer codes.
+    """
+    series = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+    selected = {str(value) for value in selected}
+    lookup = np.array([str(category) in selected for category in series.cat.categories] + ['nan' in selected])
+    return pd.Series(lookup[series.cat.codes.to_numpy()], index=series.index)
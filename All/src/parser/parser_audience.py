@@ -1,25 +1,72 @@
 import logging
 import os
 
+import numpy as np
 import pandas as pd
 import sys
 import json
-
-from openpyxl.reader.excel import load_workbook
-from openpyxl.styles import PatternFill, Font, Side, Border
+import threading
+import zipfile
+from collections import OrderedDict
+
+if __package__ in (None, ''):
+    # Run as a script: make the src directory importable so the parser package resolves.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.packaging.core import DocumentProperties
+from openpyxl.styles import PatternFill, Font, Side, Border, NamedStyle
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.xml.constants import ARC_CORE
+from openpyxl.xml.functions import fromstring
+
+from parser.key_codes import key_labels, key_mask, normalize_keys
+from parser.ratio_index import row_eop_sums
+from parser.reference_reader import read_reference
+from parser.validation import find_duplicate_keys, format_duplicate_report
+from utilities.instrumentation import instrumentation, instrumented, stage
 
 # from utils import show_message
 
 logging.basicConfig(level=logging.INFO)
 
-def load_excel(file_path):
-    return pd.read_excel(file_path)
+KEY_COLUMNS = ['PERIOD_YEAR', 'PERIOD_MONTH', 'PROD_NUM', 'BUS_CHANL_NUM']
+VIEWING_MINUTES_COLUMNS = ['LIVE_TV_VIEWING_MINUTES', 'PVR_VIEWING_MINUTES', 'CUTV_VIEWING_MINUTES',
+                           'OTT_VIEWING_MINUTES', 'VOD_VIEWING_MINUTES']
+FORECAST_STAGES = ['filter', 'duplicates', 'forecast', 'style', 'write', 'save']
+WRITE_PROGRESS_ROWS = 10000
+WIDTH_SAMPLE_ROWS = 10000
+FORECAST_FILE_NAME = "forecast_audience.xlsx"
+# Output format -> file extension; 'styled' is the formatted workbook the GUI has always produced.
+OUTPUT_FORMATS = {'styled': '.xlsx', 'xlsx': '.xlsx', 'csv': '.csv', 'parquet': '.parquet'}
+DEFAULT_OUTPUT_FORMAT = 'styled'
+REFERENCE_FILE_SUFFIX = "_reference"
+CARRIED_PROPERTIES = ['creator', 'title', 'subject', 'description', 'keywords', 'category', 'language']
 
 
-def calculate_forecast(df, references_month, references_year, target_start_year, target_end_year, specifics_enabled,
-                       prod_nums, bus_chanl_nums):
+class ForecastCancelled(Exception):
+    """Raised from a progress callback to stop a running forecast."""
+
+
+def report_progress(progress, stage):
+    """Tells the optional progress callback which FORECAST_STAGES entry is running; the callback may cancel."""
+    if progress is not None:
+        progress(stage)
+
+
+@instrumented('load', rows=len)
+def load_excel(file_path, references_month=None, references_year=None):
+    """Streams the reference file into a typed DataFrame, keeping only the reference window when one is given."""
+    return normalize_keys(read_reference(file_path, references_month, references_year))
+
+
+@instrumented('filter', rows=len)
+def select_reference_data(df, references_month, references_year, specifics_enabled, prod_nums, bus_chanl_nums):
+    """Keeps the reference window rows, restricted to the selected specifics when they are enabled."""
+    df = normalize_keys(df)
     print("Filtering reference data based on provided month and year...")
     reference_data_current_year = df[
         (df['PERIOD_YEAR'] == references_year) &
@@ -36,84 +83,154 @@ def calculate_forecast(df, references_month, references_year, target_start_year,
         print("Filtering reference data based on specifics...")
         print(f"Selected PROD_NUMs: {prod_nums}")
         print(f"Selected BUS_CHANL_NUMs: {bus_chanl_nums}")
-        unique_prod_nums = reference_data['PROD_NUM'].astype(str).unique()
-        unique_bus_chanl_nums = reference_data['BUS_CHANL_NUM'].astype(str).unique()
+        unique_prod_nums = key_labels(reference_data['PROD_NUM'])
+        unique_bus_chanl_nums = key_labels(reference_data['BUS_CHANL_NUM'])
         print(f"Unique PROD_NUMs in reference data: {unique_prod_nums}")
         print(f"Unique BUS_CHANL_NUMs in reference data: {unique_bus_chanl_nums}")
 
-        if not prod_nums:
-            prod_nums = unique_prod_nums.tolist()
-        if not bus_chanl_nums:
-            bus_chanl_nums = unique_bus_chanl_nums.tolist()
-
-        reference_data = reference_data[
-            (reference_data['PROD_NUM'].astype(str).isin(prod_nums)) &
-            (reference_data['BUS_CHANL_NUM'].astype(str).isin(bus_chanl_nums))
-            ]
+        reference_data = reference_data[specifics_mask(reference_data, prod_nums, bus_chanl_nums)]
         print(f"Reference data after specifics filter: {len(reference_data)} rows")
+    return reference_data
+
+
+def specifics_mask(df, prod_nums, bus_chanl_nums):
+    """Boolean mask of the rows matching the selected PROD_NUMs and BUS_CHANL_NUMs; an empty selection keeps all."""
+    mask = pd.Series(True, index=df.index)
+    if prod_nums:
+        mask &= key_mask(df['PROD_NUM'], prod_nums)
+    if bus_chanl_nums:
+        mask &= key_mask(df['BUS_CHANL_NUM'], bus_chanl_nums)
+    return mask
+
+
+class ForecastCache:
+    """
+    Forecasts of whole reference windows, memoized so that changing the specifics selection only slices them.
+
+    The eop volumes are summed per key and the forecast rows of a key only depend on that key's reference rows, so the
+    rows of a selection sliced from the window forecast are the ones a forecast of the selection alone gives.
+    Entries are keyed on the reference DataFrame identity and the window and target years.
+
+    The GUI forecasts on a worker thread while the Tk thread clears the cache when the reference file changes, so
+    the entries are only read and written under a lock; forecasts are computed outside it, and one stored after a
+    clear is keyed on the replaced DataFrame and never returned for the new one.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def window(self, df, references_month, references_year, target_start_year, target_end_year, ratio_index=None,
+               progress=None):
+        """Returns the window entry ('reference_df', 'forecast_df', 'duplicates'), computing it on a miss."""
+        key = (id(df), references_month, references_year, target_start_year, target_end_year)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['df'] is df:
+                self.entries.move_to_end(key)
+                return entry
+
+        reference_df = select_reference_data(df, references_month, references_year, False, [], [])
+        report_progress(progress, 'duplicates')
+        duplicates = find_duplicate_keys(reference_df, KEY_COLUMNS)
+        report_progress(progress, 'forecast')
+        forecast_df = forecast_reference(reference_df, target_start_year, target_end_year, ratio_index)
+        entry = {'df': df, 'reference_df': reference_df, 'forecast_df': forecast_df, 'duplicates': duplicates}
+        with self.lock:
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def select(self, df, references_month, references_year, target_start_year, target_end_year, specifics_enabled,
+               prod_nums, bus_chanl_nums, ratio_index=None, progress=None):
+        """
+        Returns the reference DataFrame, forecast DataFrame and duplicate report of a selection.
+
+        Only the duplicate check is redone on the selection, and only when the whole window has duplicated keys.
+        """
+        entry = self.window(df, references_month, references_year, target_start_year, target_end_year, ratio_index,
+                            progress)
+        reference_df = entry['reference_df']
+        forecast_df = entry['forecast_df']
+        if specifics_enabled:
+            reference_df = reference_df[specifics_mask(reference_df, prod_nums, bus_chanl_nums)]
+            forecast_df = forecast_df[specifics_mask(forecast_df, prod_nums, bus_chanl_nums)].reset_index(drop=True)
+            print(f"Selection sliced from the cached forecast: {len(reference_df)} reference rows")
+
+        duplicates = None
+        if entry['duplicates'] is not None:
+            duplicates = find_duplicate_keys(reference_df, KEY_COLUMNS)
+        return reference_df, forecast_df, duplicates
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+@instrumented('forecast', rows=len)
+def forecast_reference(reference_data, target_start_year, target_end_year, ratio_index=None):
+    """
+    Forecasts the target years from duplicate-free reference data.
+
+    ratio_index may be a RatioIndex built once on a larger frame, such as the whole reference file: eop volumes
+    are summed per key, and the reference filters keep or drop whole keys, so the looked-up sums are the same.
+    """
+    if ratio_index is not None:
+        sums = ratio_index.lookup(reference_data)
+    else:
+        print("Calculating reference eop volumes...")
+        sums = eop_sums(reference_data)
 
-    print("Checking for duplicates...")
-    duplicates = reference_data[
-        reference_data.duplicated(subset=['PERIOD_YEAR', 'PERIOD_MONTH', 'PROD_NUM', 'BUS_CHANL_NUM'], keep=False)
-    ]
-    if not duplicates.empty:
-        print("Duplicates found, generating error message...")
-        duplicate_info = duplicates[['PERIOD_YEAR', 'PERIOD_MONTH', 'PROD_NUM', 'BUS_CHANL_NUM']].drop_duplicates()
-        duplicate_details = "\n".join([
-            f"Year: {row.PERIOD_YEAR}, Month: {row.PERIOD_MONTH}, Prod Num: {row.PROD_NUM}, Bus Chanl Num: {row.BUS_CHANL_NUM}"
-            for idx, row in duplicate_info.iterrows()
-        ])
-
-        duplicate_rows = duplicates.index.tolist()
-        duplicate_rows_info = "\n".join([f"Row Number: {row_num}" for row_num in duplicate_rows])
-
-        error_message = f"Duplicate rows found in the reference file based on 'PERIOD_YEAR', 'PERIOD_MONTH', 'PROD_NUM', 'BUS_CHANL_NUM':\n{duplicate_details}\n\nDuplicate Rows:\n{duplicate_rows_info}"
-        # show_message("Error", error_message, type='error')
-        return pd.DataFrame(), pd.DataFrame()
+    print("Starting forecast calculation...")
+    forecast_df = expand_forecast(reference_data, sums, target_start_year, target_end_year)
 
-    print("Calculating reference eop volumes...")
-    eop_2024 = reference_data.groupby(['PERIOD_YEAR', 'PERIOD_MONTH', 'PROD_NUM', 'BUS_CHANL_NUM'])[
-        'sum_eop_vol_2024'].sum()
-    eop_2025 = reference_data.groupby(['PERIOD_YEAR', 'PERIOD_MONTH', 'PROD_NUM', 'BUS_CHANL_NUM'])[
-        'sum_eop_vol_2025'].sum()
+    print(f"Forecast calculation completed. Total forecast rows: {len(forecast_df)}")
+    return forecast_df
 
-    forecast_data = []
 
-    print("Starting forecast calculation...")
-    for year in range(target_start_year, target_end_year + 1):
-        for month in range(1, 13):
-            if month <= references_month:
-                ref_period_year = references_year
-                ref_period_month = month
-            else:
-                ref_period_year = references_year - 1
-                ref_period_month = month
+def calculate_forecast(df, references_month, references_year, target_start_year, target_end_year, specifics_enabled,
+                       prod_nums, bus_chanl_nums, progress=None):
+    """Returns the forecast and reference DataFrames, both empty when the reference keys are duplicated."""
+    report_progress(progress, 'filter')
+    reference_data = select_reference_data(df, references_month, references_year, specifics_enabled, prod_nums,
+                                           bus_chanl_nums)
+
+    report_progress(progress, 'duplicates')
+    print("Checking for duplicates...")
+    duplicates = find_duplicate_keys(reference_data, KEY_COLUMNS)
+    if duplicates is not None:
+        logging.error(format_duplicate_report(duplicates))
+        return pd.DataFrame(), pd.DataFrame()
 
-            ref_data = reference_data[
-                (reference_data['PERIOD_YEAR'] == ref_period_year) &
-                (reference_data['PERIOD_MONTH'] == ref_period_month)
-                ]
+    report_progress(progress, 'forecast')
+    return forecast_reference(reference_data, target_start_year, target_end_year), reference_data
 
-            for index, row in ref_data.iterrows():
-                prod_num = row['PROD_NUM']
-                bus_chanl_num = row['BUS_CHANL_NUM']
 
-                eop_2024_val = eop_2024.get((ref_period_year, ref_period_month, prod_num, bus_chanl_num), float('nan'))
-                eop_2025_val = eop_2025.get((ref_period_year, ref_period_month, prod_num, bus_chanl_num), float('nan'))
+def eop_sums(reference_data):
+    """Return the per-row eop_2024 and eop_2025 key sums, NaN where the forecast keeps the reference value."""
+    return row_eop_sums(reference_data, KEY_COLUMNS)
 
-                forecast_row = row.copy()
-                if not pd.isna(eop_2024_val) and eop_2024_val != 0 and not pd.isna(eop_2025_val):
-                    for col in ['LIVE_TV_VIEWING_MINUTES', 'PVR_VIEWING_MINUTES', 'CUTV_VIEWING_MINUTES',
-                                'OTT_VIEWING_MINUTES', 'VOD_VIEWING_MINUTES']:
-                        forecasted_viewing = row[col] * eop_2025_val / eop_2024_val
-                        forecast_row[col] = forecasted_viewing
-                forecast_row['PERIOD_YEAR'] = year
-                forecast_row['PERIOD_MONTH'] = month
-                forecast_data.append(forecast_row.to_dict())
 
-    print(f"Forecast calculation completed. Total forecast rows: {len(forecast_data)}")
-    return pd.DataFrame(forecast_data), reference_data
+def expand_forecast(reference_data, sums, target_start_year, target_end_year):
+    """Scale the viewing minutes by eop_2025 / eop_2024 and repeat the reference months across the target years."""
+    forecast_base = reference_data.copy()
+    scalable = sums['eop_2024'].notna()
+    for col in VIEWING_MINUTES_COLUMNS:
+        scaled = forecast_base[col] * sums['eop_2025'] / sums['eop_2024']
+        forecast_base[col] = forecast_base[col].where(~scalable, scaled)
 
+    # One reference row per calendar month: previous-year months are after references_month and current-year
+    # months up to it, so each month 1-12 maps to exactly one reference period.
+    forecast_base = forecast_base[forecast_base['PERIOD_MONTH'].isin(range(1, 13))]
+    forecast_base = forecast_base.sort_values('PERIOD_MONTH', kind='stable')
+
+    years = np.arange(target_start_year, target_end_year + 1)
+    rows_per_year = len(forecast_base)
+    forecast_df = forecast_base.iloc[np.tile(np.arange(rows_per_year), len(years))].reset_index(drop=True)
+    forecast_df['PERIOD_YEAR'] = np.repeat(years, rows_per_year)
+    return forecast_df
 
 
 def copy_sheet(source_sheet, target_sheet):
@@ -139,84 +256,249 @@ def check_file_open(file_path):
         return True
     return False
 
-def style_worksheet(ws):
-    ws.auto_filter.ref = ws.dimensions
-
-    header_fill = PatternFill(start_color="4ea72e", end_color="4ea72e", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True)
-    alternating_fill = [PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid"),
-                        PatternFill(start_color="daf2d0", end_color="daf2d0", fill_type="solid")]
-    border = Border(top=Side(style="thin", color="4ea72e"), bottom=Side(style="thin", color="4ea72e"))
+HEADER_FILL = PatternFill(start_color="4ea72e", end_color="4ea72e", fill_type="solid")
+HEADER_FONT = Font(color="FFFFFF", bold=True)
+ALTERNATING_FILL = [PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid"),
+                    PatternFill(start_color="daf2d0", end_color="daf2d0", fill_type="solid")]
+BORDER = Border(top=Side(style="thin", color="4ea72e"), bottom=Side(style="thin", color="4ea72e"))
+HEADER_STYLE_NAME = "Forecast Header"
+
+
+def value_width(series):
+    """
+    Length of the longest str() of the non-null values of series.
+
+    Categorical, integer and boolean columns are measured exactly from their categories, extremes or distinct
+    values; other columns over WIDTH_SAMPLE_ROWS rows are measured on an evenly spaced sample plus their extremes.
+    """
+    values = series.dropna()
+    if values.empty:
+        return 0
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        used = np.unique(values.cat.codes.to_numpy())
+        return max(len(str(category)) for category in values.cat.categories[used])
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return max(len(str(value)) for value in pd.unique(values))
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return max(len(str(values.min())), len(str(values.max())))
+
+    if len(values) > WIDTH_SAMPLE_ROWS:
+        sample = values.iloc[np.linspace(0, len(values) - 1, WIDTH_SAMPLE_ROWS).astype(int)]
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            sample = pd.concat([sample, pd.Series([values.min(), values.max()], dtype=values.dtype)])
+        values = sample
+    return int(values.astype(str).str.len().max())
+
+
+def column_widths(df):
+    """Width of each column: longest header or value plus padding, 8 for empty columns."""
+    widths = []
+    for col in df.columns:
+        max_length = max(len(str(col)), value_width(df[col]))
+        widths.append(max_length + 2 if max_length > 0 else 8)
+    return widths
+
+
+def style_worksheet(ws, df):
+    """Set up the autofilter, frozen header and column widths of a write-only sheet before rows are streamed."""
+    last_column = get_column_letter(max(len(df.columns), 1))
+    ws.auto_filter.ref = f"A1:{last_column}{len(df) + 1}"
+    ws.freeze_panes = 'A2'
+    for c_idx, width in enumerate(column_widths(df), 1):
+        ws.column_dimensions[get_column_letter(c_idx)].width = width
+
+
+def header_style(workbook):
+    """The named style of the header cells, registered once per workbook."""
+    if HEADER_STYLE_NAME not in workbook.named_styles:
+        workbook.add_named_style(NamedStyle(name=HEADER_STYLE_NAME, fill=HEADER_FILL, font=HEADER_FONT, border=BORDER))
+    return HEADER_STYLE_NAME
+
+
+def add_zebra_formatting(ws, df):
+    """
+    Stripe the data rows with conditional formatting rather than per-cell styles.
+
+    The two rules are complementary, so each row matches exactly one: even sheet rows, the first data row
+    included, get ALTERNATING_FILL[0] and odd rows ALTERNATING_FILL[1], both with the row border.
+    """
+    if df.empty:
+        return
+    data_range = f"A2:{get_column_letter(max(len(df.columns), 1))}{len(df) + 1}"
+    for parity, fill in enumerate(ALTERNATING_FILL):
+        ws.conditional_formatting.add(data_range, FormulaRule(formula=[f"MOD(ROW(),2)={parity}"], fill=fill,
+                                                              border=BORDER))
+
+
+def write_styled_sheet(workbook, title, df, progress=None):
+    """Stream df into a new write-only sheet with the green header and zebra rows."""
+    ws = workbook.create_sheet(title=title)
+    report_progress(progress, 'style')
+    with stage('style', rows=len(df), sheet=title):
+        style_worksheet(ws, df)
+        add_zebra_formatting(ws, df)
+        style_name = header_style(workbook)
+
+    report_progress(progress, 'write')
+    with stage('write', rows=len(df), sheet=title):
+        header = []
+        for value in df.columns:
+            cell = WriteOnlyCell(ws, value)
+            cell.style = style_name
+            header.append(cell)
+        ws.append(header)
+
+        # The data rows carry no style of their own: the zebra rules paint them.
+        for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=False)):
+            if r_idx and r_idx % WRITE_PROGRESS_ROWS == 0:
+                report_progress(progress, 'write')
+            ws.append(row)
+    return ws
+
+
+def carry_document_properties(workbook, original_file):
+    """
+    Copies the descriptive document properties (CARRIED_PROPERTIES) of the reference workbook into workbook.
+
+    Only the small docProps/core.xml part is read from the reference archive; its sheets are never parsed.
+    """
+    if not original_file:
+        return
+    try:
+        with zipfile.ZipFile(original_file) as archive:
+            source = DocumentProperties.from_tree(fromstring(archive.read(ARC_CORE)))
+    except Exception as e:
+        logging.warning(f"Could not read the document properties of {original_file}: {e}")
+        return
+    for name in CARRIED_PROPERTIES:
+        value = getattr(source, name)
+        if value is not None:
+            setattr(workbook.properties, name, value)
+
+
+def write_plain_sheet(workbook, title, df, progress=None):
+    """Stream df into a new write-only sheet, values only."""
+    ws = workbook.create_sheet(title=title)
+    report_progress(progress, 'write')
+    with stage('write', rows=len(df), sheet=title):
+        ws.append(list(df.columns))
+        for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=False)):
+            if r_idx and r_idx % WRITE_PROGRESS_ROWS == 0:
+                report_progress(progress, 'write')
+            ws.append(row)
+    return ws
+
+
+def save_plain_workbook(forecast_df, reference_df, output_filepath, original_file=None, progress=None):
+    """Working and Reference sheets without any styling."""
+    workbook = Workbook(write_only=True)
+    carry_document_properties(workbook, original_file)
+    write_plain_sheet(workbook, "Working", forecast_df, progress)
+    write_plain_sheet(workbook, "Reference", reference_df, progress)
+    set_forecast_sheet_as_active(workbook)
+
+    report_progress(progress, 'save')
+    with stage('save', path=output_filepath):
+        workbook.save(output_filepath)
 
-    max_row = ws.max_row
-    max_col = ws.max_column
 
-    for row in ws.iter_rows(min_row=1, max_row=max_row, min_col=1, max_col=max_col):
-        for cell in row:
-            cell.border = border
-            if cell.row == 1:
-                cell.fill = header_fill
-                cell.font = header_font
+def save_data_files(forecast_df, reference_df, output_filepath, output_format, progress=None):
+    """
+    Writes the forecast to output_filepath as CSV or Parquet, straight from the DataFrames, and the reference
+    rows to the same name with REFERENCE_FILE_SUFFIX.
+    """
+    stem, extension = os.path.splitext(output_filepath)
+    for title, df, path in [("Working", forecast_df, output_filepath),
+                            ("Reference", reference_df, f"{stem}{REFERENCE_FILE_SUFFIX}{extension}")]:
+        report_progress(progress, 'write')
+        with stage('write', rows=len(df), sheet=title, path=path):
+            if output_format == 'csv':
+                df.to_csv(path, index=False)
             else:
-                cell.fill = alternating_fill[(cell.row - 2) % 2]
-
-    for col in ws.iter_cols(min_row=1, max_row=max_row, min_col=1, max_col=max_col):
-        max_length = 0
-        column_letter = get_column_letter(col[0].column)
-        for cell in col:
-            if cell.value is not None:
-                max_length = max(max_length, len(str(cell.value)))
-        adjusted_width = max_length + 2 if max_length > 0 else 8
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-def save_dataframe_with_formatting(forecast_df, reference_df, output_path, original_file, references_year, prod_nums, bus_chanl_nums):
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
+                df.to_parquet(path, index=False)
 
-    output_filepath = os.path.join(output_path, "forecast_audience.xlsx")
 
+def save_forecast(forecast_df, reference_df, output_path, original_file, references_year, prod_nums, bus_chanl_nums,
+                  progress=None, file_name=FORECAST_FILE_NAME, output_format=DEFAULT_OUTPUT_FORMAT):
+    """
+    Saves the forecast and reference data in one of the OUTPUT_FORMATS.
+
+    'styled' is save_dataframe_with_formatting; 'xlsx' writes the same two sheets without styling; 'csv' and
+    'parquet' skip openpyxl altogether and write the reference rows to a second file. file_name keeps its stem
+    and takes the extension of the format.
+
+    Returns:
+        str: The path of the forecast output, or None when nothing was written.
+    """
+    if output_format == 'styled':
+        return save_dataframe_with_formatting(forecast_df, reference_df, output_path, original_file, references_year,
+                                              prod_nums, bus_chanl_nums, progress, file_name)
+    if output_format not in OUTPUT_FORMATS:
+        logging.error(f"Unknown output format {output_format}; expected one of {', '.join(OUTPUT_FORMATS)}.")
+        return None
+
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    output_filepath = os.path.join(output_path, os.path.splitext(file_name)[0] + OUTPUT_FORMATS[output_format])
     if check_file_open(output_filepath):
         logging.error(f"The file {output_filepath} is open. Please close the file and try again.")
-        return
+        return None
 
     try:
-        logging.info(f"Loading original workbook from {original_file}")
-        workbook = load_workbook(original_file)
-        reference_sheet = workbook.active
+        logging.info(f"Writing {output_format} output to {output_filepath}")
+        if output_format == 'xlsx':
+            save_plain_workbook(forecast_df, reference_df, output_filepath, original_file, progress)
+        else:
+            save_data_files(forecast_df, reference_df, output_filepath, output_format, progress)
+        logging.info(f"Data saved to {output_filepath}")
+        return output_filepath
 
-        forecast_sheet = workbook.create_sheet(title="Working")
-        new_reference_sheet = workbook.create_sheet(title="Reference")
+    except ForecastCancelled:
+        raise
+    except ImportError as e:
+        logging.error(f"The {output_format} output needs an optional package that is not installed: {e}")
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
 
-        logging.info("Writing data to the Working sheet")
-        for r_idx, row in enumerate(dataframe_to_rows(forecast_df, index=False, header=True), 1):
-            for c_idx, value in enumerate(row, 1):
-                forecast_sheet.cell(row=r_idx, column=c_idx, value=value)
 
-        logging.info("Writing data to the Reference sheet")
-        for r_idx, row in enumerate(dataframe_to_rows(reference_df, index=False, header=True), 1):
-            for c_idx, value in enumerate(row, 1):
-                new_reference_sheet.cell(row=r_idx, column=c_idx, value=value)
+def save_dataframe_with_formatting(forecast_df, reference_df, output_path, original_file, references_year, prod_nums,
+                                   bus_chanl_nums, progress=None, file_name=FORECAST_FILE_NAME):
+    """
+    Writes the styled Working and Reference sheets to a new workbook built from scratch.
+
+    original_file is only read for its document properties, so peak memory follows the output size, not the
+    reference workbook's.
+    """
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    output_filepath = os.path.join(output_path, file_name)
 
-        forecast_sheet.freeze_panes = 'A2'
-        new_reference_sheet.freeze_panes = 'A2'
+    if check_file_open(output_filepath):
+        logging.error(f"The file {output_filepath} is open. Please close the file and try again.")
+        return
 
-        logging.info("Adjusting column widths and applying styles")
-        for sheet in [forecast_sheet, new_reference_sheet]:
-            style_worksheet(sheet)
+    try:
+        workbook = Workbook(write_only=True)
+        carry_document_properties(workbook, original_file)
 
-        workbook.remove(reference_sheet)
-        new_reference_sheet.title = "Reference"
+        logging.info("Writing data to the Working sheet")
+        write_styled_sheet(workbook, "Working", forecast_df, progress)
 
-        if 'Sheet1' in workbook.sheetnames:
-            std = workbook['Sheet1']
-            workbook.remove(std)
+        logging.info("Writing data to the Reference sheet")
+        write_styled_sheet(workbook, "Reference", reference_df, progress)
 
         set_forecast_sheet_as_active(workbook)
 
+        report_progress(progress, 'save')
         logging.info(f"Saving workbook to {output_filepath}")
-        workbook.save(output_filepath)
+        with stage('save', path=output_filepath):
+            workbook.save(output_filepath)
         logging.info(f"Data saved to {output_filepath}")
+        return output_filepath
 
+    except ForecastCancelled:
+        raise
     except Exception as e:
         logging.error(f"An error occurred: {e}")
         # show_message("Error", f"An error occurred: {e}", type='error')
@@ -227,33 +509,90 @@ def set_forecast_sheet_as_active(workbook):
         workbook.active = workbook.sheetnames.index("Working")
 
 
+@instrumented('run')
+def run_forecast(df, params, progress=None, ratio_index=None, forecast_cache=None):
+    """
+    Runs the audience forecast on an already loaded reference DataFrame and saves the formatted workbook.
+
+    Args:
+        df (pd.DataFrame): The reference audience data, as read from the reference Excel file.
+        params (dict): Same keys as the CLI arguments: references_month, references_year, target_start_year,
+            target_end_year, specifics_enabled, prod_nums, bus_chanl_nums, output_dir and file_path, plus an
+            optional file_name for the workbook, FORECAST_FILE_NAME by default, and output_format, one of
+            OUTPUT_FORMATS.
+        progress (callable, optional): Called with each FORECAST_STAGES name as it starts; it may raise
+            ForecastCancelled to stop the run.
+        ratio_index (RatioIndex, optional): The eop key sums of df, built once and reused across runs.
+        forecast_cache (ForecastCache, optional): Memoized window forecasts of df; a run that only changes the
+            specifics selection then slices the cached forecast instead of recomputing it.
+
+    Returns:
+        dict: 'forecast_df' and 'reference_df' DataFrames, 'output_file', the saved workbook path or None
+        when nothing was written, and 'duplicates', the find_duplicate_keys report that stopped the run or None.
+    """
+    references_month = int(params.get('references_month', 6))
+    references_year = int(params.get('references_year', 2024))
+    target_start_year = int(params.get('target_start_year', 2025))
+    target_end_year = int(params.get('target_end_year', 2025))
+    specifics_enabled = params.get('specifics_enabled', False)
+    prod_nums = params.get('prod_nums', [])
+    bus_chanl_nums = params.get('bus_chanl_nums', [])
+    output_dir = params.get('output_dir')
+
+    report_progress(progress, 'filter')
+    if forecast_cache is not None:
+        reference_df, forecast_df, duplicates = forecast_cache.select(
+            df, references_month, references_year, target_start_year, target_end_year, specifics_enabled,
+            prod_nums, bus_chanl_nums, ratio_index, progress)
+    else:
+        reference_df = select_reference_data(df, references_month, references_year, specifics_enabled, prod_nums,
+                                             bus_chanl_nums)
+        report_progress(progress, 'duplicates')
+        duplicates = find_duplicate_keys(reference_df, KEY_COLUMNS)
+        forecast_df = None
+
+    if duplicates is not None:
+        logging.error(format_duplicate_report(duplicates))
+        return {'forecast_df': pd.DataFrame(), 'reference_df': reference_df, 'output_file': None,
+                'duplicates': duplicates}
+
+    if forecast_df is None:
+        report_progress(progress, 'forecast')
+        forecast_df = forecast_reference(reference_df, target_start_year, target_end_year, ratio_index)
+    output_file = None
+    if not forecast_df.empty:
+        output_file = save_forecast(forecast_df, reference_df, output_dir, params.get('file_path'), references_year,
+                                    prod_nums, bus_chanl_nums, progress, params.get('file_name', FORECAST_FILE_NAME),
+                                    params.get('output_format', DEFAULT_OUTPUT_FORMAT))
+    return {'forecast_df': forecast_df, 'reference_df': reference_df, 'output_file': output_file,
+            'duplicates': None}
+
+
 def main(args):
+    if 'scenarios' in args or 'scenario_file' in args:
+        from parser.batch_forecast import load_scenarios, run_batch
+        batch = load_scenarios(args['scenario_file']) if 'scenario_file' in args else args
+        for result in run_batch(batch):
+            logging.info(f"Scenario {result['name']}: {result['rows']} rows -> {result['output_file']}")
+        return
+
     file_path = args.get('file_path')
     if not file_path or not os.path.exists(file_path):
         logging.error(f"The specified file does not exist: {file_path}")
         return
 
-    references_month = int(args.get('references_month', 6))
-    references_year = int(args.get('references_year', 2024))
-    target_start_year = int(args.get('target_start_year', 2025))
-    target_end_year = int(args.get('target_end_year', 2025))
-    specifics_enabled = args.get('specifics_enabled', False)
-    prod_nums = args.get('prod_nums', [])
-    bus_chanl_nums = args.get('bus_chanl_nums', [])
     output_dir = args.get('output_dir')
     if not output_dir or not os.path.exists(output_dir):
         logging.error(f"The specified output directory does not exist: {output_dir}")
         return
 
-    df = load_excel(file_path)
-
-    forecast_df, reference_df = calculate_forecast(df, references_month, references_year, target_start_year, target_end_year, specifics_enabled, prod_nums, bus_chanl_nums)
-    if not forecast_df.empty:
-        save_dataframe_with_formatting(forecast_df, reference_df, output_dir, file_path, references_year, prod_nums, bus_chanl_nums)
+    df = load_excel(file_path, int(args.get('references_month', 6)), int(args.get('references_year', 2024)))
+    run_forecast(df, args)
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         args = json.loads(sys.argv[1])
     else:
         args = {}
-    main(args)
\ No newline at end of file
+    instrumentation.configure_from_env()
+    main(args)
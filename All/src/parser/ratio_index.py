@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+RATIO_KEY_COLUMNS = ['PERIOD_YEAR', 'PERIOD_MONTH', 'PROD_NUM', 'BUS_CHANL_NUM']
+EOP_SUM_COLUMNS = ['eop_2024', 'eop_2025']
+
+
+def code_keys(frame, key_columns):
+    """Codes each key column against its categories; returns the categories by column and the list of code arrays."""
+    categories = {}
+    codes = []
+    for col in key_columns:
+        values = frame[col]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+        categories[col] = values.cat.categories
+        codes.append(values.cat.codes.to_numpy())
+    return categories, codes
+
+
+def packing_sizes(categories):
+    """Radix of each key column when packing codes into one int64."""
+    sizes = [max(len(column_categories), 1) for column_categories in categories]
+    if np.prod([float(size) for size in sizes]) >= 2 ** 63:
+        raise ValueError("Too many distinct keys to pack the ratio index into 64-bit integers.")
+    return sizes
+
+
+def pack_codes(codes, sizes):
+    """Packs per-column codes into int64 keys; rows with a missing code are flagged invalid."""
+    packed = np.zeros(len(codes[0]), dtype=np.int64)
+    valid = np.ones(len(codes[0]), dtype=bool)
+    for column_codes, size in zip(codes, sizes):
+        valid &= column_codes >= 0
+        packed = packed * size + np.maximum(column_codes, 0)
+    return packed, valid
+
+
+def eop_volumes(reference_data):
+    """The sum_eop_vol_2024 and sum_eop_vol_2025 columns as float64 arrays, missing values as NaN."""
+    return tuple(reference_data[col].to_numpy(dtype=float, na_value=np.nan)
+                 for col in ['sum_eop_vol_2024', 'sum_eop_vol_2025'])
+
+
+def key_eop_sums(packed, eop_2024, eop_2025):
+    """
+    Sums the eop volumes per packed key, skipping NaN like groupby does.
+
+    Returns:
+        tuple: The sorted distinct keys, their (eop_2024, eop_2025) sums as an (n, 2) array, both NaN where
+        eop_2024 sums to 0 so the forecast keeps the reference values, and the position of each row's key in them.
+    """
+    keys, inverse = np.unique(packed, return_inverse=True)
+    sums = np.empty((len(keys), 2))
+    sums[:, 0] = np.bincount(inverse, weights=np.nan_to_num(eop_2024, nan=0.0), minlength=len(keys))
+    sums[:, 1] = np.bincount(inverse, weights=np.nan_to_num(eop_2025, nan=0.0), minlength=len(keys))
+    sums[sums[:, 0] == 0] = np.nan
+    return keys, sums, inverse
+
+
+def eop_sums_frame(sums, index):
+    return pd.DataFrame(sums, index=index, columns=EOP_SUM_COLUMNS)
+
+
+def row_eop_sums(reference_data, key_columns=None):
+    """
+    Per-row eop_2024 and eop_2025 sums of the row's key, without keeping an index; NaN for missing keys.
+
+    The forecast scales by value * eop_2025 / eop_2024, in that order, so both sums are kept rather than their
+    ratio, which would round differently.
+    """
+    categories, codes = code_keys(reference_data, list(key_columns or RATIO_KEY_COLUMNS))
+    packed, valid = pack_codes(codes, packing_sizes(categories.values()))
+    eop_2024, eop_2025 = eop_volumes(reference_data)
+    _, key_sums, inverse = key_eop_sums(packed[valid], eop_2024[valid], eop_2025[valid])
+    sums = np.full((len(reference_data), 2), np.nan)
+    sums[valid] = key_sums[inverse]
+    return eop_sums_frame(sums, reference_data.index)
+
+
+class RatioIndex:
+    """
+    Per-key sum_eop_vol_2024 and sum_eop_vol_2025 sums of a reference frame, the terms of the forecast ratio,
+    built once and looked up by many runs.
+
+    Each key column is coded against its categories and the four codes are packed into one int64, so the index is
+    a structured array ('key', 'eop_2024', 'eop_2025') sorted on 'key' and lookups are a vectorized searchsorted.
+    The sums are NaN when the forecast keeps the reference values: eop_2024 summing to 0, or a missing key, as
+    groupby drops those.
+    """
+
+    def __init__(self, reference_data, key_columns=None):
+        self.key_columns = list(key_columns or RATIO_KEY_COLUMNS)
+        self.categories, codes = code_keys(reference_data, self.key_columns)
+        self.sizes = packing_sizes(self.categories.values())
+
+        packed, valid = self.pack(codes)
+        eop_2024, eop_2025 = eop_volumes(reference_data)
+        keys, sums, _ = key_eop_sums(packed[valid], eop_2024[valid], eop_2025[valid])
+
+        self.table = np.empty(len(keys), dtype=[('key', 'i8'), ('eop_2024', 'f8'), ('eop_2025', 'f8')])
+        self.table['key'] = keys
+        self.table['eop_2024'] = sums[:, 0]
+        self.table['eop_2025'] = sums[:, 1]
+
+    def __len__(self):
+        return len(self.table)
+
+    def pack(self, codes):
+        return pack_codes(codes, self.sizes)
+
+    def codes_for(self, frame):
+        """Codes frame's key columns against the index categories; keys unknown to the index get -1."""
+        codes = []
+        for col in self.key_columns:
+            values = frame[col]
+            categories = self.categories[col]
+            if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.categories.equals(categories):
+                codes.append(values.cat.codes.to_numpy())
+            else:
+                codes.append(pd.Categorical(values, categories=categories).codes)
+        return codes
+
+    def lookup(self, frame):
+        """Returns the eop_2024 and eop_2025 sums of every row of frame, as row_eop_sums does, aligned on its index."""
+        if len(frame) == 0 or len(self.table) == 0:
+            return eop_sums_frame(np.full((len(frame), 2), np.nan), frame.index)
+
+        packed, valid = self.pack(self.codes_for(frame))
+        keys = self.table['key']
+        positions = np.minimum(np.searchsorted(keys, packed), len(keys) - 1)
+        found = valid & (keys[positions] == packed)
+        sums = np.column_stack([np.where(found, self.table[col][positions], np.nan) for col in EOP_SUM_COLUMNS])
+        return eop_sums_frame(sums, frame.index)
@@ -0,0 +1,144 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+from openpyxl import load_workbook
+
+VIEWING_MINUTES_DTYPE = 'float64'
+REFERENCE_DTYPES = {
+    'PERIOD_YEAR': 'int16',
+    'PERIOD_MONTH': 'int16',
+    'PROD_NUM': 'category',
+    'BUS_CHANL_NUM': 'category',
+    'LIVE_TV_VIEWING_MINUTES': VIEWING_MINUTES_DTYPE,
+    'PVR_VIEWING_MINUTES': VIEWING_MINUTES_DTYPE,
+    'CUTV_VIEWING_MINUTES': VIEWING_MINUTES_DTYPE,
+    'OTT_VIEWING_MINUTES': VIEWING_MINUTES_DTYPE,
+    'VOD_VIEWING_MINUTES': VIEWING_MINUTES_DTYPE,
+}
+DEFAULT_CHUNK_SIZE = 50000
+
+
+def reference_window_filter(references_month, references_year):
+    """
+    Builds a row filter keeping only the months calculate_forecast uses as reference:
+    months after references_month of the previous year and months up to it in the reference year.
+    """
+    def keep(year, month):
+        if not isinstance(month, (int, float)):
+            return False
+        if year == references_year:
+            return month <= references_month
+        if year == references_year - 1:
+            return month > references_month
+        return False
+    return keep
+
+
+def apply_dtypes(df, dtypes):
+    """Converts the columns of a chunk to the requested dtypes; integer columns with blanks become nullable."""
+    for col, dtype in dtypes.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'category':
+            df[col] = df[col].astype('category')
+            continue
+        values = pd.to_numeric(df[col], errors='coerce')
+        if pd.api.types.is_integer_dtype(dtype) and values.isna().any():
+            dtype = dtype.capitalize()
+        df[col] = values.astype(dtype)
+    return df
+
+
+def build_chunk(rows, row_numbers, columns, dtypes):
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    df.index = pd.Index(row_numbers)
+    return apply_dtypes(df, dtypes)
+
+
+def iter_reference_chunks(file_path, sheet_name=None, chunk_size=DEFAULT_CHUNK_SIZE, row_filter=None,
+                          dtypes=None):
+    """
+    Streams a reference sheet with openpyxl read-only mode and yields typed DataFrame chunks.
+
+    Args:
+        file_path (str): The reference Excel file.
+        sheet_name (str, optional): The sheet to read, the first sheet by default.
+        chunk_size (int): Maximum number of rows per yielded chunk.
+        row_filter (callable, optional): Called as row_filter(PERIOD_YEAR, PERIOD_MONTH); rows for which it
+            returns False are dropped before any DataFrame is built.
+        dtypes (dict, optional): Column dtypes, REFERENCE_DTYPES by default.
+
+    Yields:
+        pd.DataFrame: Chunks of at most chunk_size rows, with the header row as columns and indexed like
+        pd.read_excel would (sheet row number minus 2), so row numbers survive the filtering.
+    """
+    if dtypes is None:
+        dtypes = REFERENCE_DTYPES
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        width = len(header)
+        while width and header[width - 1] is None:
+            width -= 1
+        columns = [name if name is not None else f"Unnamed: {idx}" for idx, name in enumerate(header[:width])]
+
+        year_idx = columns.index('PERIOD_YEAR') if row_filter is not None else None
+        month_idx = columns.index('PERIOD_MONTH') if row_filter is not None else None
+
+        buffer = []
+        row_numbers = []
+        for row_number, row in enumerate(rows, 2):
+            row = row[:width]
+            if all(value is None for value in row):
+                continue
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            if row_filter is not None and not row_filter(row[year_idx], row[month_idx]):
+                continue
+            buffer.append(row)
+            row_numbers.append(row_number - 2)
+            if len(buffer) >= chunk_size:
+                yield build_chunk(buffer, row_numbers, columns, dtypes)
+                buffer = []
+                row_numbers = []
+        if buffer:
+            yield build_chunk(buffer, row_numbers, columns, dtypes)
+    finally:
+        workbook.close()
+
+
+def concat_chunks(chunks):
+    """Concatenates typed chunks, merging the categories of categorical columns instead of falling back to object."""
+    chunks = list(chunks)
+    if not chunks:
+        return pd.DataFrame()
+    if len(chunks) == 1:
+        return chunks[0]
+
+    categorical = [col for col, dtype in chunks[0].dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    df = pd.concat([chunk.drop(columns=categorical) for chunk in chunks])
+    for col in categorical:
+        try:
+            df[col] = union_categoricals([chunk[col] for chunk in chunks])
+        except TypeError:
+            # Chunks inferred different category types (e.g. int and float when a chunk has blanks).
+            df[col] = pd.concat([chunk[col].astype(object) for chunk in chunks]).astype('category')
+    return df[chunks[0].columns]
+
+
+def read_reference(file_path, references_month=None, references_year=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   sheet_name=None, dtypes=None):
+    """
+    Reads a reference sheet as one compact, typed DataFrame.
+
+    When references_month and references_year are given, only the rows of the forecast reference window are kept.
+    """
+    row_filter = None
+    if references_month is not None and references_year is not None:
+        row_filter = reference_window_filter(int(references_month), int(references_year))
+    return concat_chunks(iter_reference_chunks(file_path, sheet_name=sheet_name, chunk_size=chunk_size,
+                                               row_filter=row_filter, dtypes=dtypes))
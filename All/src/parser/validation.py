@@ -0,0 +1,77 @@
+import pandas as pd
+
+from utilities.instrumentation import stage
+
+DEFAULT_MAX_EXAMPLES = 20
+HEADER_ROWS = 1
+
+
+def to_python(value):
+    """Converts NumPy scalars to plain Python values so reports stay JSON serializable."""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def find_duplicate_keys(reference_data, key_columns, max_examples=DEFAULT_MAX_EXAMPLES):
+    """
+    Finds reference rows sharing the same key, hashing the key columns once.
+
+    Rows are first matched on a 64-bit hash of their key; only those candidates are compared on the actual
+    key values, so hash collisions cannot produce false duplicates.
+
+    Args:
+        reference_data (pd.DataFrame): The reference rows, indexed by their 0-based data row as read from the sheet.
+        key_columns (list): The columns forming the key.
+        max_examples (int): Maximum number of duplicated keys detailed in the report.
+
+    Returns:
+        dict: None when every key is unique, otherwise 'key_columns', 'duplicate_keys' (number of distinct keys
+        that repeat), 'duplicate_rows' (number of rows involved) and 'examples', a list of the first
+        max_examples keys as dicts with their sheet row numbers under 'rows'.
+    """
+    with stage('dedupe', rows=len(reference_data)) as event:
+        keys = reference_data[key_columns]
+        hashes = pd.util.hash_pandas_object(keys, index=False)
+        candidates = hashes.duplicated(keep=False).to_numpy()
+        if not candidates.any():
+            return None
+
+        candidate_keys = keys[candidates]
+        exact = candidate_keys.duplicated(keep=False).to_numpy()
+        if not exact.any():
+            return None
+
+        duplicate_keys = candidate_keys[exact]
+        duplicate_hashes = hashes[candidates][exact].to_numpy()
+        distinct_hashes = pd.unique(duplicate_hashes)
+        event['duplicate_rows'] = len(duplicate_keys)
+
+        examples = []
+        for key_hash in distinct_hashes[:max_examples]:
+            rows = duplicate_keys[duplicate_hashes == key_hash]
+            example = {col: to_python(rows[col].iloc[0]) for col in key_columns}
+            example['rows'] = [int(idx) + HEADER_ROWS + 1 for idx in rows.index]
+            examples.append(example)
+
+        return {
+            'key_columns': list(key_columns),
+            'duplicate_keys': len(distinct_hashes),
+            'duplicate_rows': len(duplicate_keys),
+            'examples': examples,
+        }
+
+
+def format_duplicate_report(report):
+    """Renders a duplicate report as the text shown to the user."""
+    lines = [
+        f"Duplicate rows found in the reference file based on {', '.join(report['key_columns'])}:",
+        f"{report['duplicate_keys']} keys repeated over {report['duplicate_rows']} rows.",
+        "",
+    ]
+    for example in report['examples']:
+        key = ", ".join(f"{col}: {example[col]}" for col in report['key_columns'])
+        rows = ", ".join(str(row) for row in example['rows'])
+        lines.append(f"{key} -> rows {rows}")
+    hidden = report['duplicate_keys'] - len(report['examples'])
+    if hidden > 0:
+        lines.append(f"... and {hidden} more keys.")
+    return "\n".join(lines)
@@ -1,8 +1,4 @@
-import json
 import os
-import subprocess
-import sys
-import time
 import traceback
 from datetime import datetime
 from tkinter import filedialog, Listbox, MULTIPLE, BooleanVar, Toplevel
@@ -10,9 +6,18 @@ from tkinter import ttk
 
 import pandas as pd
 
+from parser import parser_audience
+from parser.key_codes import key_labels, key_mask, normalize_keys
+from parser.ratio_index import RatioIndex
+from parser.reference_reader import read_reference
+from parser.validation import format_duplicate_report
 from utilities import utils
+from utilities.excel_cache import excel_cache
+from utilities.job_runner import JobRunner, ProgressPopup
 from utilities.utils import show_message
 
+REFERENCE_CACHE_KEY = 'typed reference'
+
 
 class AudienceTab(ttk.Frame):
     def __init__(self, parent, config_manager, base_dir, config_ui_callback=None):
@@ -25,6 +30,11 @@ class AudienceTab(ttk.Frame):
         self.output_dir = None
         self.tooltip = None
         self.df = None
+        self.raw_df = None
+        self.ratio_index = None
+        self.forecast_cache = parser_audience.ForecastCache()
+        self.forecast_job = None
+        self.progress_popup = None
         self.config_ui_callback = config_ui_callback
         self.config_manager = config_manager
         self.config_data = config_manager.get_config()
@@ -176,14 +186,14 @@ class AudienceTab(ttk.Frame):
             # Only clear listbox if not initialized
             if not hasattr(self, 'prod_num_map') or self.prod_num_map is None:
                 self.prod_num_listbox.delete(0, 'end')
-                unique_prod_num = sorted(set(str(item) for item in self.df['PROD_NUM'].unique()))
+                unique_prod_num = key_labels(self.df['PROD_NUM'])
                 for value in unique_prod_num:
                     self.prod_num_listbox.insert('end', value)
                 self.prod_num_map = {str(value): str(value) for value in unique_prod_num}
 
             if not hasattr(self, 'bus_chanl_num_map') or self.bus_chanl_num_map is None:
                 self.bus_chanl_num_listbox.delete(0, 'end')
-                unique_bus_chanl_num = sorted(set(str(item) for item in self.df['BUS_CHANL_NUM'].unique()))
+                unique_bus_chanl_num = key_labels(self.df['BUS_CHANL_NUM'])
                 for value in unique_bus_chanl_num:
                     self.bus_chanl_num_listbox.insert('end', value)
                 self.bus_chanl_num_map = {str(value): str(value) for value in unique_bus_chanl_num}
@@ -312,9 +322,8 @@ class AudienceTab(ttk.Frame):
 
         # select matching
         if selected_bus_chanl_nums:
-            related_prod_nums = set(
-                self.df[self.df['BUS_CHANL_NUM'].astype(str).isin(selected_bus_chanl_nums)]['PROD_NUM'].dropna().astype(
-                    str))
+            related_prod_nums = set(key_labels(
+                self.df.loc[key_mask(self.df['BUS_CHANL_NUM'], selected_bus_chanl_nums), 'PROD_NUM'], dropna=True))
 
             # Mapping to LOOKUP_KEY values
             if hasattr(self, 'lookup_key_to_prod_num') and self.lookup_key_to_prod_num:
@@ -339,12 +348,10 @@ class AudienceTab(ttk.Frame):
         # Mapping LOOKUP_KEYto the original PROD_NUM
         selected_prod_nums_mapped = [self.prod_num_map.get(lookup_key, lookup_key) for lookup_key in selected_prod_nums]
 
-        filtered_df = self.df[
-            (self.df['PROD_NUM'].astype(str).isin(selected_prod_nums_mapped)) &
-            (self.df['BUS_CHANL_NUM'].astype(str).isin(selected_bus_chanl_nums))
-            ]
+        selected_rows = int((key_mask(self.df['PROD_NUM'], selected_prod_nums_mapped) &
+                             key_mask(self.df['BUS_CHANL_NUM'], selected_bus_chanl_nums)).sum())
 
-        self.row_count_label.config(text=f"Selected Rows: {len(filtered_df)}")
+        self.row_count_label.config(text=f"Selected Rows: {selected_rows}")
         self.prod_count_label.config(text=f"Selected Products: {len(set(selected_prod_nums))}")
 
         self.section_specifics_listbox_highlight_top(self.bus_chanl_num_listbox)
@@ -446,42 +453,67 @@ class AudienceTab(ttk.Frame):
                 show_message("Error", "No output directory selected.", type='error', master=self, custom=True)
                 return
 
-            start_time = time.time()
-
-            self.call_script(references_month, references_year, target_start_year, target_end_year,
-                             file_path, specifics_enabled, selected_prod_nums_values, selected_bus_chanl_nums_values)
-
-            end_time = time.time()
-            duration = end_time - start_time
-            show_message("Info", f"Parsing completed in {duration:.2f} seconds.", type='info', master=self, custom=True)
+            params = {
+                "references_month": references_month,
+                "references_year": references_year,
+                "target_start_year": target_start_year,
+                "target_end_year": target_end_year,
+                "file_path": file_path,
+                "output_dir": self.output_dir,
+                "specifics_enabled": specifics_enabled,
+                "prod_nums": selected_prod_nums_values,
+                "bus_chanl_nums": selected_bus_chanl_nums_values
+            }
+            self.run_forecast(params)
         else:
             show_message("Error", "Validation failed. Please correct the errors and try again.", type='error',
                          master=self, custom=True)
 
-    def call_script(self, references_month, references_year, target_start_year, target_end_year,
-                    file_path, specifics_enabled, prod_nums, bus_chanl_nums):
-
-        if not self.base_dir:
-            raise ValueError("Base directory is not set.")
-        script_path = os.path.join(self.base_dir, 'parser', 'audience_parser.py')
-        script_path = os.path.abspath(script_path)
-        print(f"Script Path: {script_path}")
+    def run_forecast(self, params):
+        """Runs the forecast on a worker thread, on the reference DataFrame already loaded in the tab."""
+        if self.forecast_job is not None and self.forecast_job.is_running():
+            show_message("Info", "A forecast is already running.", type='info', master=self, custom=True)
+            return
 
-        output_dir = self.output_dir
+        df = self.load_reference_data()
+        self.progress_popup = ProgressPopup(self, "Audience forecast", parser_audience.FORECAST_STAGES,
+                                            on_cancel=lambda: self.forecast_job.cancel())
+
+        def forecast(progress):
+            return parser_audience.run_forecast(df, params, progress, self.reference_ratio_index(df),
+                                                self.forecast_cache)
+
+        self.forecast_job = JobRunner(self, forecast,
+                                      on_progress=self.progress_popup.update_stage,
+                                      on_done=self.forecast_done,
+                                      on_error=self.forecast_failed,
+                                      cancelled_error=parser_audience.ForecastCancelled)
+        self.forecast_job.start()
+
+    def forecast_done(self, result, timings):
+        self.progress_popup.destroy()
+        if result['duplicates'] is not None:
+            show_message("Error", format_duplicate_report(result['duplicates']), type='error', master=self,
+                         custom=True)
+            return
+        if result['output_file'] is None:
+            show_message("Error", "No forecast file was written. Check the reference data and try again.",
+                         type='error', master=self, custom=True)
+            return
+        show_message("Info", f"Parsing completed in {sum(timings.values()):.2f} seconds.\n\n"
+                             f"{self.format_timings(timings)}", type='info', master=self, custom=True)
 
-        args = {
-            "references_month": references_month,
-            "references_year": references_year,
-            "target_start_year": target_start_year,
-            "target_end_year": target_end_year,
-            "file_path": file_path,
-            "output_dir": output_dir,
-            "specifics_enabled": specifics_enabled,
-            "prod_nums": prod_nums,
-            "bus_chanl_nums": bus_chanl_nums
-        }
+    def forecast_failed(self, error, timings):
+        self.progress_popup.destroy()
+        if isinstance(error, parser_audience.ForecastCancelled):
+            show_message("Info", f"Forecast cancelled after {sum(timings.values()):.2f} seconds.", type='info',
+                         master=self, custom=True)
+        else:
+            show_message("Error", f"Forecast failed: {error}", type='error', master=self, custom=True)
 
-        subprocess.run(["python", script_path, json.dumps(args)])
+    @staticmethod
+    def format_timings(timings):
+        return "\n".join(f"{stage}: {seconds:.2f} s" for stage, seconds in timings.items())
 
     def sections_reference_target_datefields(self, parent, context):
         if context == 'REFERENCE':
@@ -585,15 +617,13 @@ class AudienceTab(ttk.Frame):
         filepath = filedialog.askopenfilename(filetypes=filetypes)
         if filepath:
             self.section_reference_details_update(filepath)
-            self.df = pd.read_excel(filepath)
 
     def section_reference_details_update(self, file_path):
         self.file_path = file_path
         try:
-            df = pd.read_excel(file_path)
+            df = self.load_reference_data()
             self.config_manager.update_config('audience_src', file_path)
             print("File loaded, checking content...")
-            self.df = pd.read_excel(file_path)
             if df.empty:
                 print("DataFrame is empty after loading.")
             else:
@@ -608,6 +638,25 @@ class AudienceTab(ttk.Frame):
             self.file_details_label.config(text="Failed to load file or file is empty")
             show_message("Error", f"Exception occurred: {str(e)}", type='error', master=self, custom=True)
 
+    def load_reference_data(self):
+        """
+        Returns the reference DataFrame, re-parsing the file only when it changed on disk.
+
+        The file is read by the same typed reader as load_excel, so the GUI forecasts the values the CLI does.
+        """
+        raw_df = excel_cache.read(self.file_path, REFERENCE_CACHE_KEY, read_reference)
+        if raw_df is not self.raw_df:
+            self.raw_df = raw_df
+            self.df = normalize_keys(raw_df)
+            self.forecast_cache.clear()
+        return self.df
+
+    def reference_ratio_index(self, df):
+        """Returns the eop ratio index of df, built on the first forecast and reused until the reference changes."""
+        if self.ratio_index is None or self.ratio_index[0] is not df:
+            self.ratio_index = (df, RatioIndex(df, parser_audience.KEY_COLUMNS))
+        return self.ratio_index[1]
+
     def setup_show_columns_button(self, parent, context):
         """Sets up a button to show column names from the loaded DataFrame."""
         if context == 'REFERENCE':
@@ -618,7 +667,7 @@ class AudienceTab(ttk.Frame):
         """Displays the column names from the loaded DataFrame."""
         if self.file_path:
             try:
-                df = pd.read_excel(self.file_path)
+                df = self.load_reference_data()
                 columns = '\n'.join(df.columns)
                 show_message("Columns", f"Columns in the file:\n{columns}", type='info', master=self, custom=True)
             except Exception as e:
@@ -682,7 +731,7 @@ class AudienceTab(ttk.Frame):
     def validate_references(self):
         if self.file_path:
             try:
-                df = pd.read_excel(self.file_path)
+                df = self.load_reference_data()
                 month = int(self.references_month.get())
                 year = int(self.references_year.get())
 
@@ -720,7 +769,7 @@ class AudienceTab(ttk.Frame):
                 start_year = int(self.target_start_year.get())
                 end_year = int(self.target_end_year.get())
 
-                df = pd.read_excel(self.file_path)
+                self.load_reference_data()
 
                 current_year = datetime.now().year
 
@@ -1,12 +1,21 @@
+import os
 import tkinter as tk
-import tkinter.font as tkFont
 from tkinter import ttk, filedialog
 
 import pandas as pd
 
 from utilities import utils
 from utilities.config_manager import ConfigManager
+from utilities.edit_journal import UPDATE, EditJournal, apply_edits
+from utilities.excel_cache import excel_cache, file_fingerprint
+from utilities.facet_index import FacetIndex
 from utilities.utils import show_message, open_file_and_update_config
+from utilities.virtual_tree import VirtualTreeview
+from utilities.xlsx_patch import PatchError, StaleRowError, patch_cells
+
+COST_SHEET_NAME = 'all contract cost file'
+FLUSH_DELAY_MS = 15000
+FACET_COLUMNS = ['NETWORK_NAME', 'CNT_NAME_GRP', 'Business model']
 
 
 class CostTab(ttk.Frame):
@@ -17,6 +26,15 @@ class CostTab(ttk.Frame):
         self.config_data = config_manager.get_config()
         self.file_path = self.config_data.get('cost_src', None)
         self.data = None
+        self.saved_data = None
+        self.facets = None
+        self.base_fingerprint = None
+        self.sheet_name = COST_SHEET_NAME
+        self.sheet_columns = []
+        self.data_positions = []
+        self.sheet_rows = 0
+        self.flush_after_id = None
+        self.journal = EditJournal(os.path.join(os.path.dirname(config_manager.config_file), 'journal.sqlite'))
         self.network_name_var = tk.StringVar()
         self.cnt_name_grp_var = tk.StringVar()
         self.business_model_var = tk.StringVar()
@@ -37,13 +55,34 @@ class CostTab(ttk.Frame):
         #     self.load_file(self.file_path)
 
     def load_file(self, path):
-        self.file_path = path
         # self.config_manager.update_config('cost_src', path)
         self.load_cost_reference_file(path)
 
     def load_cost_reference_file(self, file_path):
+        # The edits of the file loaded so far are saved to it before anything points at the new one. A file changed
+        # on disk can never be saved to, so it may still be reloaded; its edits are then dropped as stale.
+        if not self.flush_edits() and not self.file_changed():
+            return
         try:
-            self.data = pd.read_excel(file_path, sheet_name='all contract cost file')
+            fingerprint = file_fingerprint(file_path)
+            sheet_name = self.find_relevant_sheet(file_path)
+            if sheet_name is None:
+                raise ValueError(f"no sheet has the columns {', '.join(FACET_COLUMNS)}")
+            sheet_columns = excel_cache.sheet_headers(file_path)[sheet_name]
+            data_positions = self.used_positions(sheet_columns)
+            data = excel_cache.read_excel(file_path, sheet_name=sheet_name, usecols=data_positions).copy()
+            if len(data.columns) != len(data_positions):
+                raise ValueError(f"the header row of {sheet_name} does not match its columns")
+
+            self.file_path = file_path
+            self.base_fingerprint = fingerprint
+            self.sheet_name = sheet_name
+            self.sheet_columns = sheet_columns
+            self.data_positions = data_positions
+            self.data = data
+            self.saved_data = data.copy()
+            self.sheet_rows = len(data)
+            self.recover_edits()
             self.populate_dropdowns()
 
             # Enable the filtering comboboxes once the file is loaded
@@ -115,6 +154,10 @@ class CostTab(ttk.Frame):
         tree_xscroll.grid(row=1, column=0, sticky="ew")
         self.tree.configure(xscrollcommand=tree_xscroll.set)
 
+        tree_yscroll = ttk.Scrollbar(tree_container, orient="vertical")
+        tree_yscroll.grid(row=0, column=1, sticky="ns")
+        self.table = VirtualTreeview(self.tree, tree_yscroll)
+
         tree_container.columnconfigure(0, weight=1)
         tree_container.rowconfigure(0, weight=1)
 
@@ -126,50 +169,68 @@ class CostTab(ttk.Frame):
         self.rowconfigure(1, weight=1)
 
     def find_relevant_sheet(self, file_path):
-        xls = pd.ExcelFile(file_path)
-        for sheet_name in xls.sheet_names:
-            df = pd.read_excel(xls, sheet_name=sheet_name)
-            if {'NETWORK_NAME', 'CNT_NAME_GRP', 'Business model'}.issubset(df.columns):
-                return df
-        return None
+        """
+        Name of the sheet holding the deals: COST_SHEET_NAME when it has the FACET_COLUMNS, else the first sheet
+        that has them, or None. Only the header rows are read.
+        """
+        sheets = [sheet_name for sheet_name, header in excel_cache.sheet_headers(file_path).items()
+                  if set(FACET_COLUMNS).issubset(header)]
+        if COST_SHEET_NAME in sheets:
+            return COST_SHEET_NAME
+        return sheets[0] if sheets else None
+
+    def used_positions(self, sheet_columns):
+        """
+        Positions of the sheet columns the tab shows or filters on, in sheet order; the others are not loaded.
+
+        Columns are loaded and written back by position, as headers may repeat or be empty.
+        """
+        used = set(FACET_COLUMNS).union(*self.model_columns.values())
+        return [idx for idx, col in enumerate(sheet_columns) if col in used]
+
+    def sheet_position(self, col):
+        """0-based sheet column of a loaded column of self.data, or None for a column added since the load."""
+        idx = self.data.columns.get_loc(col) if col in self.data.columns else len(self.data_positions)
+        return self.data_positions[idx] if idx < len(self.data_positions) else None
 
     def populate_dropdowns(self):
         self.data['NETWORK_NAME'] = self.data['NETWORK_NAME'].astype(str)
         self.data['CNT_NAME_GRP'] = self.data['CNT_NAME_GRP'].astype(str)
         self.data['Business model'] = self.data['Business model'].astype(str)
+        self.index_facets()
 
-        network_names = [''] + sorted(self.data['NETWORK_NAME'].dropna().unique())
-        cnt_name_grps = [''] + sorted(self.data['CNT_NAME_GRP'].dropna().unique())
-        business_models = [''] + sorted(self.data['Business model'].dropna().unique())
+        network_names = [''] + self.facets.choices('NETWORK_NAME')
+        cnt_name_grps = [''] + self.facets.choices('CNT_NAME_GRP')
+        business_models = [''] + self.facets.choices('Business model')
 
         self.network_name_dropdown['values'] = network_names
         self.cnt_name_grp_dropdown['values'] = cnt_name_grps
         self.business_model_dropdown['values'] = business_models
 
+    def index_facets(self):
+        """Rebuilds the facet index of the dropdown columns; needed whenever rows are added or edited."""
+        self.facets = FacetIndex(self.data, FACET_COLUMNS)
+
     def update_dropdowns(self, event=None):
         network_name_selected = self.network_name_var.get()
         cnt_name_grp_selected = self.cnt_name_grp_var.get()
         business_model_selected = self.business_model_var.get()
 
-        filtered_data = self.data.copy()
-        if network_name_selected:
-            filtered_data = filtered_data[filtered_data['NETWORK_NAME'] == network_name_selected]
-        if cnt_name_grp_selected:
-            filtered_data = filtered_data[filtered_data['CNT_NAME_GRP'] == cnt_name_grp_selected]
-        if business_model_selected:
-            filtered_data = filtered_data[filtered_data['Business model'] == business_model_selected]
+        selection = {col: value for col, value in zip(FACET_COLUMNS, [network_name_selected, cnt_name_grp_selected,
+                                                                       business_model_selected]) if value}
+        rows = self.facets.rows(selection)
 
-        network_names = [''] + sorted(filtered_data['NETWORK_NAME'].dropna().unique())
+        network_names = [''] + self.facets.choices('NETWORK_NAME', rows)
         current_network_name = self.network_name_var.get()
         self.network_name_dropdown['values'] = network_names
         self.network_name_var.set(current_network_name if current_network_name in network_names else '')
 
-        cnt_name_grps = [''] + sorted(filtered_data['CNT_NAME_GRP'].dropna().unique())
+        cnt_name_grps = [''] + self.facets.choices('CNT_NAME_GRP', rows)
         current_cnt_name_grp = self.cnt_name_grp_var.get()
         self.cnt_name_grp_dropdown['values'] = cnt_name_grps
         self.cnt_name_grp_var.set(current_cnt_name_grp if current_cnt_name_grp in cnt_name_grps else '')
 
-        business_models = [''] + sorted(filtered_data['Business model'].dropna().unique())
+        business_models = [''] + self.facets.choices('Business model', rows)
         current_business_model = self.business_model_var.get()
         self.business_model_dropdown['values'] = business_models
         self.business_model_var.set(current_business_model if current_business_model in business_models else '')
@@ -178,29 +239,12 @@ class CostTab(ttk.Frame):
             self.display_metadata(network_name_selected, cnt_name_grp_selected, business_model_selected)
 
     def display_metadata(self, network_name, cnt_name_grp, business_model):
-        for column in self.tree.get_children():
-            self.tree.delete(column)
-
         columns = self.model_columns.get(business_model, [])
+        filtered_rows = self.data.iloc[self.facets.rows(dict(zip(FACET_COLUMNS,
+                                                                 [network_name, cnt_name_grp, business_model])))]
 
-        self.tree["columns"] = columns
-        for col in columns:
-            self.tree.heading(col, text=col)
-            self.tree.column(col, width=tkFont.Font().measure(col) + 20)
-
-        filtered_rows = self.data[
-            (self.data['NETWORK_NAME'] == network_name) &
-            (self.data['CNT_NAME_GRP'] == cnt_name_grp) &
-            (self.data['Business model'] == business_model)
-        ]
-
-        for _, row in filtered_rows.iterrows():
-            values = [row[col] for col in columns]
-            self.tree.insert("", tk.END, values=values)
-
-        for col in columns:
-            max_width = max((tkFont.Font().measure(str(self.tree.set(item, col))) for item in self.tree.get_children()), default=100)
-            self.tree.column(col, width=max_width + 20)
+        # Items are identified by the row label, which stays valid as deals are added and edited.
+        self.table.show(filtered_rows, columns)
 
 
 
@@ -250,7 +294,7 @@ class CostTab(ttk.Frame):
         cancel_button.grid(row=len(columns), column=1, padx=10, pady=20, sticky='w')
 
     def open_update_deal_popup(self):
-        selected_items = self.tree.selection()
+        selected_items = self.table.selection()
         if not selected_items:
             show_message("Warning", "Please select at least one deal to update", master=self, custom=True)
             return
@@ -297,28 +341,178 @@ class CostTab(ttk.Frame):
 
     def populate_update_deal_entries(self):
         item_id = self.items_to_update[self.current_update_index]
-        values = self.tree.item(item_id, "values")
+        values = self.table.values(item_id)
         for col, value in zip(self.tree["columns"], values):
             self.update_deal_entries[col].set(value)
 
     def update_deal_row(self, index, new_values):
         item_id = self.items_to_update[index]
-        item_idx = self.tree.index(item_id)
+        item_idx = int(item_id)
 
         for col, val in new_values.items():
             self.data.at[item_idx, col] = val
 
-        self.save_updated_data()
+        self.journal.record_update(self.base_fingerprint, self.sheet_name, item_idx, new_values)
+        self.index_facets()
+        self.schedule_flush()
         self.display_metadata(self.network_name_var.get(), self.cnt_name_grp_var.get(), self.business_model_var.get())
 
     def add_new_deal_row(self, new_row):
         self.data = pd.concat([self.data, pd.DataFrame([new_row])], ignore_index=True)
-        self.save_updated_data()
+        self.journal.record_insert(self.base_fingerprint, self.sheet_name, new_row.to_dict())
+        self.index_facets()
+        self.schedule_flush()
         self.display_metadata(self.network_name_var.get(), self.cnt_name_grp_var.get(), self.business_model_var.get())
 
+    def recover_edits(self):
+        """Replays onto self.data the deal edits a previous session journaled but never wrote to the cost file."""
+        edits = self.journal.pending(self.base_fingerprint[0], self.sheet_name)
+        current = [edit for edit in edits if edit['base'] == self.base_fingerprint[1:]]
+        stale = [edit for edit in edits if edit['base'] != self.base_fingerprint[1:]]
+        if stale:
+            # The file was rewritten after these edits: by a save that stopped before clearing them, or elsewhere.
+            print(f"Dropping {len(stale)} journaled edits made on an older version of {self.base_fingerprint[0]}")
+            self.journal.remove([edit['id'] for edit in stale])
+            show_message("Error", f"{len(stale)} unsaved deal edits were made on an older version of the cost file "
+                                  f"and could not be replayed onto it.", type='error', master=self, custom=True)
+        if current:
+            self.data = apply_edits(self.data, current)
+            show_message("Recovered", f"{len(current)} unsaved deal edits were recovered and will be saved to the "
+                                      f"cost file.", master=self, custom=True)
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        """Writes the journaled edits FLUSH_DELAY_MS after the last one, so a burst of submits costs one save."""
+        if self.flush_after_id is not None:
+            self.after_cancel(self.flush_after_id)
+        self.flush_after_id = self.after(FLUSH_DELAY_MS, self.flush_edits)
+
+    def flush_edits(self):
+        """
+        Saves the cost sheet once with every journaled edit, then clears them from the journal.
+
+        Edits are written to the file self.data was loaded from, base_fingerprint[0], whatever file_path says, and
+        only while that file is still the version loaded: rows are written by position.
+
+        Returns:
+            bool: False when the save failed; the edits then stay journaled for the next attempt.
+        """
+        if self.flush_after_id is not None:
+            self.after_cancel(self.flush_after_id)
+            self.flush_after_id = None
+        if self.data is None or self.base_fingerprint is None:
+            return True
+        file_path = self.base_fingerprint[0]
+        edits = self.journal.pending(file_path, self.sheet_name)
+        if not edits:
+            return True
+        if self.file_changed():
+            show_message("Error", f"The cost file changed on disk since it was loaded, the {len(edits)} unsaved deal "
+                                  f"edits are not saved over it. Reload the file to go on editing.",
+                         type='error', master=self, custom=True)
+            return False
+
+        try:
+            if not self.patch_updates(edits):
+                self.save_updated_data()
+        except Exception as e:
+            show_message("Error", f"Failed to save the cost file, the edits are kept for the next save: {e}",
+                         type='error', master=self, custom=True)
+            return False
+        self.base_fingerprint = file_fingerprint(file_path)
+        self.journal.remove([edit['id'] for edit in edits])
+        excel_cache.invalidate(file_path)
+        return True
+
+    def patch_updates(self, edits):
+        """
+        Writes journaled updates by rewriting only their cells in the cost sheet.
+
+        A row label maps to sheet row label + 2, below the header. Before anything is written, every loaded cell
+        of the patched rows is checked against saved_data, the row as the file held it, as deal rows share their
+        network and contract group and only the whole row tells them apart.
+
+        Returns:
+            bool: False when the whole sheet has to be saved instead: inserted rows, new columns, or cells that
+            cannot be patched.
+
+        Raises:
+            ValueError: The file changed on disk, or a patched row does not match; nothing was written.
+        """
+        self.ensure_unchanged()
+        if any(edit['kind'] != UPDATE or edit['row_index'] >= self.sheet_rows for edit in edits):
+            return False
+        updated = {}
+        for edit in edits:
+            updated.setdefault(edit['row_index'], set()).update(edit['values'])
+        if any(self.sheet_position(col) is None for cols in updated.values() for col in cols):
+            return False
+
+        cells = {}
+        expected = {}
+        for label, cols in updated.items():
+            for col in cols:
+                cells[(label + 2, self.sheet_position(col) + 1)] = self.data.at[label, col]
+            for col, position in zip(self.saved_data.columns, self.data_positions):
+                expected[(label + 2, position + 1)] = self.saved_data.at[label, col]
+        try:
+            patch_cells(self.base_fingerprint[0], self.sheet_name, cells, expected)
+        except StaleRowError as e:
+            # Neither a patch nor a whole-sheet save, which matches rows by position too, may write over this sheet.
+            raise ValueError(f"the cost sheet no longer holds the deals it was loaded with ({e}); reload it")
+        except PatchError as e:
+            print(f"Saving the whole cost sheet: {e}")
+            return False
+        for label, cols in updated.items():
+            for col in cols:
+                self.saved_data.at[label, col] = self.data.at[label, col]
+        return True
+
+    def file_changed(self):
+        """True when the loaded cost file was rewritten on disk since it was loaded or last saved by the tab."""
+        try:
+            return file_fingerprint(self.base_fingerprint[0]) != self.base_fingerprint
+        except OSError:
+            return True
+
+    def ensure_unchanged(self):
+        """Raises ValueError when the cost file changed on disk, as saving over it would mix the two versions."""
+        if self.file_changed():
+            raise ValueError(f"{self.base_fingerprint[0]} changed on disk since it was loaded")
+
+    def sheet_frame(self):
+        """
+        self.data completed with the sheet columns it was loaded without, in sheet order, for a whole-sheet save.
+
+        Columns are matched by sheet position, never by header, and the columns added since the load come last.
+        The columns that were not loaded are parsed again from the workbook on every whole-sheet save, and rows are
+        matched by position, so the workbook must be the one self.data was loaded from.
+        """
+        loaded = len(self.data_positions)
+        rest_positions = [idx for idx in range(len(self.sheet_columns)) if idx not in self.data_positions]
+        frame = self.data
+        if rest_positions:
+            rest = pd.read_excel(self.base_fingerprint[0], sheet_name=self.sheet_name, usecols=rest_positions)
+            if len(rest) != self.sheet_rows or len(rest.columns) != len(rest_positions):
+                raise ValueError(f"the sheet {self.sheet_name} changed since it was loaded")
+            frame = pd.concat([self.data, rest], axis=1)
+
+        # Frame column of each sheet position: the loaded columns come first in the frame, then the re-read ones.
+        frame_columns = dict(zip(self.data_positions, range(loaded)))
+        frame_columns.update((idx, len(self.data.columns) + offset) for offset, idx in enumerate(rest_positions))
+        order = [frame_columns[idx] for idx in range(len(self.sheet_columns))]
+        order += list(range(loaded, len(self.data.columns)))
+        return frame.iloc[:, order]
+
     def save_updated_data(self):
-        with pd.ExcelWriter(self.file_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-            self.data.to_excel(writer, sheet_name='all contract cost file', index=False)
+        self.ensure_unchanged()
+        frame = self.sheet_frame()
+        with pd.ExcelWriter(self.base_fingerprint[0], engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+            frame.to_excel(writer, sheet_name=self.sheet_name, index=False)
+        self.data_positions = self.data_positions + list(range(len(self.sheet_columns), len(frame.columns)))
+        self.sheet_columns = list(frame.columns)
+        self.sheet_rows = len(frame)
+        self.saved_data = self.data.copy()
 
     def show_tooltip(self, event, text):
         self.tooltip = utils.tooltip_show(event, text, self)
@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+INSERT = 'insert'
+UPDATE = 'update'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS edits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_path TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    base TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    row_index INTEGER,
+    row_values TEXT NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+
+class EditJournal:
+    """
+    Append-only SQLite journal of the row inserts and updates made to a workbook sheet but not yet written to it.
+
+    Every edit is committed as soon as it is recorded, so it survives a crash, and carries the fingerprint of the
+    workbook it was made on (base). Edits are removed once the workbook has been rewritten with them; an edit whose
+    base no longer matches the workbook on disk is already in it, or was overtaken by an outside change.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(self.db_path)
+            with self.connection:
+                self.connection.execute(SCHEMA)
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def record(self, fingerprint, sheet_name, kind, values, row_index=None):
+        """
+        Args:
+            fingerprint (tuple): file_fingerprint of the workbook the edit was made on.
+            sheet_name (str): Edited sheet.
+            kind (str): INSERT or UPDATE.
+            values (dict): Column values of the inserted row, or the updated columns.
+            row_index (int, optional): DataFrame index label of the updated row.
+
+        Returns:
+            int: The id of the edit, increasing in recording order.
+        """
+        path, mtime_ns, size = fingerprint
+        connection = self.connect()
+        with connection:
+            cursor = connection.execute(
+                "INSERT INTO edits (file_path, sheet_name, base, kind, row_index, row_values, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, sheet_name, json.dumps([mtime_ns, size]), kind, row_index, json.dumps(values, default=str),
+                 time.time()))
+        return cursor.lastrowid
+
+    def record_insert(self, fingerprint, sheet_name, values):
+        return self.record(fingerprint, sheet_name, INSERT, values)
+
+    def record_update(self, fingerprint, sheet_name, row_index, values):
+        return self.record(fingerprint, sheet_name, UPDATE, values, row_index=int(row_index))
+
+    def pending(self, file_path, sheet_name):
+        """Returns the edits of the sheet in recording order, as dicts with id, base, kind, row_index and values."""
+        rows = self.connect().execute(
+            "SELECT id, base, kind, row_index, row_values FROM edits WHERE file_path = ? AND sheet_name = ? "
+            "ORDER BY id", (os.path.abspath(file_path), sheet_name))
+        return [{'id': edit_id, 'base': tuple(json.loads(base)), 'kind': kind, 'row_index': row_index,
+                 'values': json.loads(values)}
+                for edit_id, base, kind, row_index, values in rows]
+
+    def remove(self, edit_ids):
+        """Drops the given edits, typically once the workbook has been saved with them."""
+        connection = self.connect()
+        with connection:
+            connection.executemany("DELETE FROM edits WHERE id = ?", [(edit_id,) for edit_id in edit_ids])
+
+
+def apply_edits(df, edits):
+    """
+    Replays journaled edits onto df in recording order and returns the resulting DataFrame.
+
+    Consecutive inserts are appended in one concat; updates address rows by index label, as recorded.
+    """
+    inserts = []
+    for edit in edits:
+        if edit['kind'] == INSERT:
+            inserts.append(edit['values'])
+            continue
+        if inserts:
+            df = pd.concat([df, pd.DataFrame(inserts)], ignore_index=True)
+            inserts = []
+        for col, value in edit['values'].items():
+            df.at[edit['row_index'], col] = value
+    if inserts:
+        df = pd.concat([df, pd.DataFrame(inserts)], ignore_index=True)
+    return df
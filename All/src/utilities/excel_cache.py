@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+import openpyxl
+import pandas as pd
+
+DEFAULT_SIDECAR_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 4
+
+
+def file_fingerprint(file_path):
+    """Returns (absolute path, mtime in ns, size), which changes whenever the file is rewritten on disk."""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size
+
+
+def file_content_hash(file_path, chunk_size=1024 * 1024):
+    """Returns the sha256 hex digest of the file content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SidecarCache:
+    """
+    On-disk cache of parsed Excel sheets, stored as pandas pickles in cache_dir.
+
+    index.json maps each source path and sheet to its fingerprint, content hash, sidecar file and last use.
+    A source whose mtime or size changed is re-hashed, so touching a file does not force a re-parse, while
+    any content change does. Least recently used sidecars are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_SIDECAR_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.index = self.load_index()
+
+    def load_index(self):
+        try:
+            with open(self.index_file, 'r') as file:
+                return json.load(file)
+        except (json.JSONDecodeError, ValueError, FileNotFoundError):
+            return {}
+
+    def save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as file:
+            json.dump(self.index, file, indent=4)
+        os.replace(tmp_file, self.index_file)
+
+    @staticmethod
+    def entry_key(path, sheet_name):
+        return f"{path}|{sheet_name}"
+
+    def sidecar_path(self, entry):
+        return os.path.join(self.cache_dir, entry['sidecar'])
+
+    def get(self, fingerprint, sheet_name):
+        """Returns the cached DataFrame for the source, or None when it has to be parsed again."""
+        path, mtime_ns, size = fingerprint
+        key = self.entry_key(path, sheet_name)
+        entry = self.index.get(key)
+        if entry is None or not os.path.isfile(self.sidecar_path(entry)):
+            return None
+
+        if [entry['mtime_ns'], entry['size']] != [mtime_ns, size]:
+            if entry['size'] != size or entry['sha256'] != file_content_hash(path):
+                self.remove(key)
+                self.save_index()
+                return None
+            entry['mtime_ns'] = mtime_ns
+
+        try:
+            df = pd.read_pickle(self.sidecar_path(entry))
+        except Exception as e:
+            print(f"Discarding unreadable cache file {entry['sidecar']}: {e}")
+            self.remove(key)
+            self.save_index()
+            return None
+
+        entry['last_used'] = time.time()
+        self.save_index()
+        return df
+
+    def put(self, fingerprint, sheet_name, df):
+        """Writes df as the sidecar of the source and evicts old sidecars beyond max_bytes."""
+        path, mtime_ns, size = fingerprint
+        key = self.entry_key(path, sheet_name)
+        content_hash = file_content_hash(path)
+        sheet_tag = hashlib.sha256(str(sheet_name).encode('utf-8')).hexdigest()[:8]
+        sidecar = f"{content_hash[:32]}_{sheet_tag}.pkl"
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        sidecar_file = os.path.join(self.cache_dir, sidecar)
+        tmp_file = sidecar_file + '.tmp'
+        df.to_pickle(tmp_file, compression=None)
+        os.replace(tmp_file, sidecar_file)
+
+        if key in self.index and self.index[key]['sidecar'] != sidecar:
+            self.remove(key)
+        self.index[key] = {
+            'mtime_ns': mtime_ns,
+            'size': size,
+            'sha256': content_hash,
+            'sidecar': sidecar,
+            'bytes': os.path.getsize(sidecar_file),
+            'last_used': time.time(),
+        }
+        self.evict()
+        self.save_index()
+
+    def remove(self, key):
+        entry = self.index.pop(key, None)
+        if entry is None:
+            return
+        if any(other['sidecar'] == entry['sidecar'] for other in self.index.values()):
+            return
+        try:
+            os.remove(self.sidecar_path(entry))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Removes least recently used sidecars until the cache fits in max_bytes."""
+        total = sum(entry['bytes'] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= entry['bytes']
+            self.remove(key)
+
+
+class ExcelCache:
+    """
+    In-memory cache of parsed Excel sheets, keyed on the file fingerprint and the sheet name.
+
+    Only the latest fingerprint of a file is kept, and at most max_entries sheets, least recently used first out,
+    as a parsed reference export can take gigabytes.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.headers = {}
+        self.sidecar = None
+
+    def enable_sidecar(self, cache_dir, max_bytes=DEFAULT_SIDECAR_MAX_BYTES):
+        """Backs the in-memory cache with a SidecarCache in cache_dir, reused across application starts."""
+        self.sidecar = SidecarCache(cache_dir, max_bytes)
+
+    def read_excel(self, file_path, sheet_name=0, usecols=None):
+        """
+        Reads a sheet through pd.read_excel, re-parsing the file only when its mtime or size changed.
+
+        A sheet read with usecols is cached apart from the same sheet read whole. The returned DataFrame is shared
+        between callers and must not be modified in place.
+        """
+        usecols = list(usecols) if usecols is not None else None
+        sheet_key = sheet_name if usecols is None else f"{sheet_name}|{'|'.join(map(str, usecols))}"
+        return self.read(file_path, sheet_key, lambda path: pd.read_excel(path, sheet_name=sheet_name, usecols=usecols))
+
+    def read(self, file_path, cache_key, reader):
+        """
+        Returns reader(file_path), cached under cache_key like a sheet and re-read only when the file changed.
+
+        Lets a parser other than pd.read_excel, such as the typed reference reader, share the memory and sidecar
+        caches. The returned DataFrame is shared between callers and must not be modified in place.
+        """
+        fingerprint = file_fingerprint(file_path)
+        key = (fingerprint[0], cache_key)
+        cached = self.entries.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            self.entries.move_to_end(key)
+            return cached[1]
+
+        # Sheets of an older version of the file are never read again; dropping them before the parse keeps a
+        # single copy of the file in memory.
+        stale = [other for other, entry in self.entries.items() if other[0] == key[0] and entry[0] != fingerprint]
+        for other in stale:
+            del self.entries[other]
+        self.entries.pop(key, None)
+
+        df = self.sidecar.get(fingerprint, cache_key) if self.sidecar is not None else None
+        if df is None:
+            df = reader(file_path)
+            if self.sidecar is not None:
+                try:
+                    self.sidecar.put(fingerprint, cache_key, df)
+                except OSError as e:
+                    print(f"Could not write the cache file for {file_path}: {e}")
+        self.entries[key] = (fingerprint, df)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return df
+
+    def sheet_headers(self, file_path):
+        """
+        Maps each worksheet name to its first row, read in read-only mode so the rows below are never parsed.
+
+        Empty cells after the last header are dropped, as formatted but empty columns reach them, so positions in
+        the list are the column positions pd.read_excel sees. Cached per file fingerprint, like the sheets themselves.
+        """
+        fingerprint = file_fingerprint(file_path)
+        cached = self.headers.get(fingerprint[0])
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            headers = {}
+            for ws in workbook.worksheets:
+                header = list(next(ws.iter_rows(max_row=1, values_only=True), ()))
+                while header and header[-1] is None:
+                    header.pop()
+                headers[ws.title] = header
+        finally:
+            workbook.close()
+        self.headers[fingerprint[0]] = (fingerprint, headers)
+        return headers
+
+    def invalidate(self, file_path=None):
+        """Drops the cached sheets of file_path, or of every file when no path is given."""
+        if file_path is None:
+            self.entries.clear()
+            self.headers.clear()
+            return
+        path = os.path.abspath(file_path)
+        for key in [key for key in self.entries if key[0] == path]:
+            del self.entries[key]
+        self.headers.pop(path, None)
+
+
+excel_cache = ExcelCache()
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+NO_ROWS = np.empty(0, dtype=np.intp)
+
+
+class FacetIndex:
+    """
+    Row positions of every value of a few columns, for cascading filters that never scan or copy the frame.
+
+    Each column is factorized once into sorted category codes; the rows holding a value are a sorted position
+    array, so a selection is the intersection of the arrays of its values and the choices left in a column are
+    the distinct codes over the selected rows.
+    """
+
+    def __init__(self, df, columns):
+        self.columns = list(columns)
+        self.values = {}
+        self.codes = {}
+        self.positions = {}
+        for col in self.columns:
+            codes, uniques = pd.factorize(df[col], sort=True)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self.values[col] = list(uniques)
+            self.codes[col] = codes
+            self.positions[col] = {value: order[bounds[idx]:bounds[idx + 1]] for idx, value in enumerate(uniques)}
+
+    def rows(self, selection):
+        """
+        Args:
+            selection (dict): {column: value} pairs that must all match.
+
+        Returns:
+            numpy.ndarray: The sorted row positions matching the selection, or None for an empty selection.
+        """
+        rows = None
+        for col, value in selection.items():
+            matched = self.positions[col].get(value, NO_ROWS)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+    def choices(self, column, rows=None):
+        """Sorted distinct non-null values of column over rows, or over every row when rows is None."""
+        if rows is None:
+            return list(self.values[column])
+        codes = np.unique(self.codes[column][rows])
+        return [self.values[column][code] for code in codes if code >= 0]
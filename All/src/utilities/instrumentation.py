@@ -0,0 +1,214 @@
+import cProfile
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EVENTS_ENV = 'AUDIENCE_EVENTS'
+PROFILE_DIR_ENV = 'AUDIENCE_PROFILE_DIR'
+TRACE_MEMORY_ENV = 'AUDIENCE_TRACE_MEMORY'
+TRACEMALLOC_TOP_LINES = 25
+
+
+def max_rss_bytes():
+    """Peak resident memory of the process so far, or None where the resource module is missing."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class JsonLinesSink:
+    """Appends every event to a file as one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+
+
+class Instrumentation:
+    """
+    Emits one structured event per pipeline stage: its duration, row count and memory.
+
+    Stages are measured only once a sink, a profile directory or memory tracing is configured, so the parser pays
+    nothing more than a flag check by default. Stages may nest; each event names its parent stage.
+    """
+
+    def __init__(self):
+        self.sinks = []
+        self.profile_dir = None
+        self.trace_memory = False
+        self.local = threading.local()
+        self.profile_lock = threading.Lock()
+        self.profiling_thread = None
+        self.sequence = itertools.count(1)
+
+    def configure(self, events_path=None, profile_dir=None, trace_memory=False):
+        """
+        Args:
+            events_path (str, optional): JSON-lines file the events are appended to.
+            profile_dir (str, optional): Directory receiving a cProfile dump per stage, plus the top tracemalloc
+                allocations when memory is traced. A stage's dump leaves out its nested stages, dumped apart.
+            trace_memory (bool): Starts tracemalloc and adds the traced peak of each stage to its event.
+        """
+        if events_path:
+            self.add_sink(JsonLinesSink(events_path))
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+            self.profile_dir = profile_dir
+        if trace_memory:
+            self.trace_memory = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    def configure_from_env(self, environ=None):
+        """Configures from AUDIENCE_EVENTS, AUDIENCE_PROFILE_DIR and AUDIENCE_TRACE_MEMORY."""
+        environ = os.environ if environ is None else environ
+        self.configure(events_path=environ.get(EVENTS_ENV), profile_dir=environ.get(PROFILE_DIR_ENV),
+                       trace_memory=environ.get(TRACE_MEMORY_ENV, '') not in ('', '0'))
+
+    def add_sink(self, sink):
+        """Registers a callable receiving each event dict."""
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def is_active(self):
+        return bool(self.sinks) or self.profile_dir is not None or self.trace_memory
+
+    def emit(self, event):
+        logging.debug(f"Stage {event['stage']}: {event['seconds']:.3f}s, {event.get('rows')} rows")
+        for sink in list(self.sinks):
+            try:
+                sink(event)
+            except Exception as e:
+                logging.error(f"Instrumentation sink failed: {e}")
+
+    def start_profile(self):
+        """
+        Starts a profiler for a stage, pausing the one of its parent stage until stop_profile.
+
+        Only one profiler can be enabled at a time in a process, so stages are profiled on the first thread that
+        starts one until its outermost profiled stage ends; stages of other threads meanwhile get no dump.
+        """
+        if self.profile_dir is None:
+            return None
+        with self.profile_lock:
+            if self.profiling_thread not in (None, threading.get_ident()):
+                return None
+            self.profiling_thread = threading.get_ident()
+        profilers = self.local.__dict__.setdefault('profilers', [])
+        if profilers:
+            profilers[-1].disable()
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+        return profiler
+
+    def stop_profile(self, profiler, name, event):
+        profiler.disable()
+        profilers = self.local.profilers
+        profilers.pop()
+        prefix = os.path.join(self.profile_dir, f"{next(self.sequence):04d}_{name}")
+        profiler.dump_stats(f"{prefix}.prof")
+        event['profile'] = f"{prefix}.prof"
+        if self.trace_memory:
+            top = tracemalloc.take_snapshot().statistics('lineno')[:TRACEMALLOC_TOP_LINES]
+            with open(f"{prefix}.tracemalloc.txt", 'w', encoding='utf-8') as file:
+                file.write('\n'.join(str(stat) for stat in top) + '\n')
+        if profilers:
+            profilers[-1].enable()
+        else:
+            with self.profile_lock:
+                self.profiling_thread = None
+
+    @contextmanager
+    def stage(self, name, rows=None, **fields):
+        """
+        Measures the enclosed block as one stage and emits its event when the block ends, even on error.
+
+        Yields the event dict; the block may set event['rows'] or other fields known only once it has run.
+        """
+        if not self.is_active():
+            yield {}
+            return
+
+        stack = self.local.__dict__.setdefault('stack', [])
+        event = {
+            'event': 'stage',
+            'stage': name,
+            'parent': stack[-1]['stage'] if stack else None,
+            'thread': threading.current_thread().name,
+            'started': datetime.now().isoformat(timespec='milliseconds'),
+            'rows': rows,
+        }
+        event.update(fields)
+        frame = {'stage': name, 'child_peak': 0}
+        stack.append(frame)
+
+        if self.trace_memory:
+            traced_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        profiler = self.start_profile()
+        started = perf_counter()
+        try:
+            yield event
+        except BaseException as e:
+            event['error'] = type(e).__name__
+            raise
+        finally:
+            event['seconds'] = perf_counter() - started
+            stack.pop()
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                # A nested stage resets the peak, so fold the peaks of the children back in.
+                peak = max(peak, frame['child_peak'])
+                event['traced_bytes'] = current - traced_before
+                event['traced_peak_bytes'] = peak
+                if stack:
+                    stack[-1]['child_peak'] = max(stack[-1]['child_peak'], peak)
+            event['max_rss_bytes'] = max_rss_bytes()
+            if profiler is not None:
+                self.stop_profile(profiler, name, event)
+            self.emit(event)
+
+    def instrumented(self, name, rows=None):
+        """Decorator measuring each call as stage name; rows, if given, computes the row count from the result."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as event:
+                    result = func(*args, **kwargs)
+                    if rows is not None and event:
+                        event['rows'] = rows(result)
+                    return result
+            return wrapper
+        return decorator
+
+
+instrumentation = Instrumentation()
+stage = instrumentation.stage
+instrumented = instrumentation.instrumented
@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from tkinter import ttk, Toplevel
+
+from utilities.utils import center_window
+
+
+class JobRunner:
+    """Runs a function on a worker thread and relays its progress to the Tk main loop through a queue polled with after()."""
+
+    def __init__(self, master, target, on_progress=None, on_done=None, on_error=None, cancelled_error=None,
+                 poll_ms=100):
+        """
+        Args:
+            master (tk.Widget): Widget whose after() drives the queue polling.
+            target (callable): Called on the worker thread as target(progress); progress(stage) reports a stage.
+            on_progress (callable, optional): Called on the main thread with each new stage name.
+            on_done (callable, optional): Called on the main thread with the target's return value and the stage timings.
+            on_error (callable, optional): Called on the main thread with the raised exception and the stage timings.
+            cancelled_error (type, optional): Exception raised from progress() once cancel() has been requested.
+            poll_ms (int): Delay between two queue polls, in milliseconds.
+        """
+        self.master = master
+        self.target = target
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled_error = cancelled_error or RuntimeError
+        self.poll_ms = poll_ms
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.stage_timings = {}
+        self.current_stage = None
+        self.stage_started = None
+
+    def start(self):
+        self.thread.start()
+        self.master.after(self.poll_ms, self.poll)
+
+    def cancel(self):
+        """Requests cancellation; the target stops at its next progress report."""
+        self.cancel_event.set()
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+    def progress(self, stage):
+        if self.cancel_event.is_set():
+            raise self.cancelled_error("Cancelled by the user.")
+        self.messages.put(('progress', stage, time.perf_counter()))
+
+    def run(self):
+        try:
+            result = self.target(self.progress)
+        except Exception as e:
+            self.messages.put(('error', e, time.perf_counter()))
+        else:
+            self.messages.put(('done', result, time.perf_counter()))
+
+    def record_stage(self, stage, timestamp):
+        """Closes the running stage at timestamp and opens the given one, summing repeated stages."""
+        if self.current_stage is not None:
+            elapsed = timestamp - self.stage_started
+            self.stage_timings[self.current_stage] = self.stage_timings.get(self.current_stage, 0.0) + elapsed
+        self.current_stage = stage
+        self.stage_started = timestamp
+
+    def poll(self):
+        while True:
+            try:
+                kind, payload, timestamp = self.messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'progress':
+                if payload == self.current_stage:
+                    continue
+                self.record_stage(payload, timestamp)
+                if self.on_progress:
+                    self.on_progress(payload)
+                continue
+
+            self.record_stage(None, timestamp)
+            callback = self.on_done if kind == 'done' else self.on_error
+            if callback:
+                callback(payload, self.stage_timings)
+            return
+
+        self.master.after(self.poll_ms, self.poll)
+
+
+class ProgressPopup(Toplevel):
+    """Small window showing the running stage of a JobRunner, with a Cancel button."""
+
+    def __init__(self, master, title, stages, on_cancel):
+        super().__init__(master)
+        self.title(title)
+        self.stages = stages
+        self.on_cancel = on_cancel
+        self.resizable(False, False)
+        center_window(self, master, 360, 130)
+        self.transient(master)
+
+        self.stage_label = ttk.Label(self, text="Starting...")
+        self.stage_label.pack(side='top', fill='x', padx=15, pady=(15, 5))
+
+        self.progressbar = ttk.Progressbar(self, mode='determinate', maximum=len(stages))
+        self.progressbar.pack(side='top', fill='x', padx=15, pady=5)
+
+        self.cancel_button = ttk.Button(self, text="Cancel", command=self.cancel)
+        self.cancel_button.pack(side='top', pady=(5, 10))
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+
+    def update_stage(self, stage):
+        self.stage_label.config(text=f"Running: {stage}")
+        if stage in self.stages:
+            self.progressbar['value'] = max(self.progressbar['value'], self.stages.index(stage) + 1)
+
+    def cancel(self):
+        self.stage_label.config(text="Cancelling...")
+        self.cancel_button.config(state='disabled')
+        self.on_cancel()
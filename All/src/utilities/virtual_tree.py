@@ -0,0 +1,145 @@
+import tkinter.font as tkFont
+from tkinter import ttk
+
+import numpy as np
+
+WIDTH_SAMPLE_ROWS = 200
+DEFAULT_COLUMN_WIDTH = 100
+COLUMN_PADDING = 20
+WHEEL_UNITS = 3
+
+
+def column_array(values):
+    """
+    The values of a column as a NumPy array whose items print as the Series items do.
+
+    datetime64 and timedelta64 columns are boxed to Timestamp and Timedelta, as numpy's own scalars print as
+    '2024-01-01T00:00:00.000000000' instead of '2024-01-01 00:00:00'.
+    """
+    if values.dtype.kind in 'mM':
+        return values.astype(object).to_numpy()
+    return values.to_numpy()
+
+
+class VirtualTreeview:
+    """
+    Shows the rows of a DataFrame in a ttk.Treeview that only holds the items of the visible window.
+
+    Column values are kept as NumPy arrays and every scroll refills the window from them, so showing or scrolling
+    costs the same for ten rows or a million. Items are identified by str(row label); the selection is tracked
+    here, as selected rows scrolled out of the window no longer have an item.
+    """
+
+    def __init__(self, tree, yscrollbar):
+        self.tree = tree
+        self.yscrollbar = yscrollbar
+        self.font = tkFont.nametofont(ttk.Style().lookup('Treeview', 'font') or 'TkDefaultFont')
+        self.text_widths = {}
+        self.columns = []
+        self.arrays = {}
+        self.labels = np.empty(0, dtype=object)
+        self.first = 0
+        self.window = 1
+        self.selected = set()
+
+        yscrollbar.configure(command=self.yview)
+        tree.bind('<Configure>', self.on_resize)
+        tree.bind('<<TreeviewSelect>>', self.on_select)
+        tree.bind('<MouseWheel>', lambda e: self.scroll(-WHEEL_UNITS if e.delta > 0 else WHEEL_UNITS))
+        tree.bind('<Button-4>', lambda e: self.scroll(-WHEEL_UNITS))
+        tree.bind('<Button-5>', lambda e: self.scroll(WHEEL_UNITS))
+        tree.bind('<Up>', lambda e: self.step_focus(-1))
+        tree.bind('<Down>', lambda e: self.step_focus(1))
+
+    def text_width(self, text):
+        """Pixel width of text in the tree font, memoized since the font never changes."""
+        width = self.text_widths.get(text)
+        if width is None:
+            if len(self.text_widths) > 10000:
+                self.text_widths.clear()
+            width = self.text_widths[text] = self.font.measure(text)
+        return width
+
+    def show(self, df, columns):
+        """Replaces the displayed rows with the columns of df, scrolled to the top and with nothing selected."""
+        self.columns = list(columns)
+        self.arrays = {col: column_array(df[col]) for col in self.columns}
+        self.labels = df.index.to_numpy()
+        self.first = 0
+        self.selected = set()
+
+        self.tree["columns"] = self.columns
+        sample = np.unique(np.linspace(0, len(df) - 1, min(len(df), WIDTH_SAMPLE_ROWS)).astype(int))
+        for col in self.columns:
+            self.tree.heading(col, text=col)
+            width = max((self.text_width(str(value)) for value in self.arrays[col][sample]),
+                        default=DEFAULT_COLUMN_WIDTH)
+            self.tree.column(col, width=width + COLUMN_PADDING)
+        self.refill()
+
+    def selection(self):
+        """Item ids of the selected rows, in display order, whether or not they are in the window."""
+        return tuple(str(label) for label in self.labels if str(label) in self.selected)
+
+    def values(self, item_id):
+        """The displayed values of a row, as the Treeview would return them for its item."""
+        position = np.flatnonzero(self.labels.astype(str) == item_id)[0]
+        return tuple(str(self.arrays[col][position]) for col in self.columns)
+
+    def visible_rows(self):
+        """Number of rows fitting the tree height, below the heading."""
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or self.font.metrics('linespace') + 4)
+        return max(1, self.tree.winfo_height() // row_height - 1)
+
+    def refill(self):
+        self.tree.delete(*self.tree.get_children())
+        end = min(len(self.labels), self.first + self.window)
+        for position in range(self.first, end):
+            self.tree.insert("", "end", iid=str(self.labels[position]),
+                             values=[self.arrays[col][position] for col in self.columns])
+        self.tree.selection_set([item for item in self.tree.get_children() if item in self.selected])
+        if len(self.labels):
+            self.yscrollbar.set(self.first / len(self.labels), end / len(self.labels))
+        else:
+            self.yscrollbar.set(0, 1)
+
+    def scroll_to(self, first):
+        first = max(0, min(int(first), len(self.labels) - self.window))
+        if first != self.first:
+            self.first = first
+            self.refill()
+
+    def scroll(self, units):
+        self.scroll_to(self.first + units)
+        return 'break'
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', count, 'units' or 'pages')."""
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * len(self.labels))
+        elif args[0] == 'scroll':
+            self.scroll(int(args[1]) * (self.window if args[2] == 'pages' else 1))
+
+    def step_focus(self, step):
+        """Arrow keys past the first or last item of the window scroll it by one row."""
+        items = self.tree.get_children()
+        if not items or self.tree.focus() != (items[0] if step < 0 else items[-1]):
+            return None
+        self.scroll(step)
+        items = self.tree.get_children()
+        target = items[0] if step < 0 else items[-1]
+        self.selected = set()
+        self.tree.focus(target)
+        self.tree.selection_set(target)
+        return 'break'
+
+    def on_resize(self, event=None):
+        window = self.visible_rows()
+        if window != self.window:
+            self.window = window
+            self.first = max(0, min(self.first, len(self.labels) - window))
+            self.refill()
+
+    def on_select(self, event=None):
+        visible = set(self.tree.get_children())
+        self.selected = (self.selected - visible) | set(self.tree.selection())
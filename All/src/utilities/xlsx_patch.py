@@ -0,0 +1,196 @@
+import datetime
+import math
+import numbers
+import os
+import posixpath
+import re
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import numpy as np
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.datetime import from_excel
+
+SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+CELL_PATTERN = re.compile(r'<c\b[^>]*?\br="([A-Z]+)\d+"[^>]*?(?:/>|>.*?</c>)', re.DOTALL)
+STYLE_PATTERN = re.compile(r'\bs="(\d+)"')
+TYPE_PATTERN = re.compile(r'\bt="(\w+)"')
+
+
+class PatchError(Exception):
+    """The sheet cannot be patched in place; the caller should rewrite it as a whole."""
+
+
+class StaleRowError(PatchError):
+    """A row located by position does not hold the expected values: the sheet is not the version the caller has."""
+
+
+def sheet_part(archive, sheet_name):
+    """Returns the archive path of the worksheet XML of sheet_name."""
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    relation_id = None
+    for sheet in workbook.iter(f'{{{SPREADSHEET_NS}}}sheet'):
+        if sheet.get('name') == sheet_name:
+            relation_id = sheet.get(f'{{{RELATIONSHIP_NS}}}id')
+    if relation_id is None:
+        raise PatchError(f"No sheet named {sheet_name}")
+
+    relations = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relation in relations.iter(f'{{{PACKAGE_RELATIONSHIP_NS}}}Relationship'):
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    raise PatchError(f"No part for sheet {sheet_name}")
+
+
+def shared_strings(archive):
+    try:
+        root = ElementTree.fromstring(archive.read('xl/sharedStrings.xml'))
+    except KeyError:
+        return []
+    return [''.join(text.text or '' for text in item.iter(f'{{{SPREADSHEET_NS}}}t'))
+            for item in root.iter(f'{{{SPREADSHEET_NS}}}si')]
+
+
+def find_row(sheet_xml, row):
+    """Returns the (start, end) span of the <row> element numbered row."""
+    match = re.search(rf'<row\b[^>]*?\br="{row}"[^>]*?(/?)>', sheet_xml)
+    if match is None:
+        raise PatchError(f"Row {row} is not in the sheet")
+    if match.group(1):
+        return match.start(), match.end()
+    end = sheet_xml.find('</row>', match.end())
+    return match.start(), end + len('</row>')
+
+
+def cell_value(cell, strings):
+    """The value of a <c> element: a str, bool or float, as stored, or None when it holds no value."""
+    element = ElementTree.fromstring(cell.replace('<c ', f'<c xmlns="{SPREADSHEET_NS}" ', 1))
+    kind = element.get('t')
+    if kind == 'inlineStr':
+        return ''.join(text.text or '' for text in element.iter(f'{{{SPREADSHEET_NS}}}t'))
+    value = element.find(f'{{{SPREADSHEET_NS}}}v')
+    if value is None or value.text is None:
+        return None
+    if kind == 's':
+        return strings[int(value.text)]
+    if kind == 'b':
+        return value.text == '1'
+    if kind in ('str', 'e'):
+        return value.text
+    return float(value.text)
+
+
+def same_value(found, expected):
+    """
+    Whether a cell_value is the value pd.read_excel loaded from the cell: NaN and NaT stand for an empty cell, and
+    dates are stored as serial numbers.
+    """
+    if expected is None or expected != expected:
+        return found is None or found == ''
+    if isinstance(expected, (bool, np.bool_)):
+        return isinstance(found, bool) and found == expected
+    if isinstance(expected, (datetime.datetime, datetime.date)):
+        return isinstance(found, float) and from_excel(found) == expected
+    if isinstance(expected, numbers.Real):
+        return isinstance(found, float) and found == float(expected)
+    return found == expected
+
+
+def cell_xml(reference, value, style=None):
+    """Serializes value as a <c> element; strings are written inline, so sharedStrings.xml stays untouched."""
+    attributes = f' r="{reference}"' + (f' s="{style}"' if style is not None else '')
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return f'<c{attributes}/>'
+    if isinstance(value, bool):
+        return f'<c{attributes} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Integral):
+        return f'<c{attributes}><v>{int(value)}</v></c>'
+    if isinstance(value, numbers.Real):
+        if not math.isfinite(value):
+            raise PatchError(f"Cannot write {value} to {reference}")
+        return f'<c{attributes}><v>{float(value)!r}</v></c>'
+    if not isinstance(value, str):
+        raise PatchError(f"Cannot write a {type(value).__name__} to {reference}")
+    space = ' xml:space="preserve"' if value != value.strip() else ''
+    return f'<c{attributes} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'
+
+
+def patch_row(row_xml, row, values):
+    """Rewrites the cells of one <row> element; values maps column numbers to their new value."""
+    if row_xml.endswith('/>'):
+        row_xml = row_xml[:-2] + '></row>'
+    head_end = row_xml.find('>') + 1
+    cells = [(column_index_from_string(match.group(1)), match.group(0))
+             for match in CELL_PATTERN.finditer(row_xml, head_end)]
+    existing = dict(cells)
+
+    patched = dict(existing)
+    for column, value in values.items():
+        old = existing.get(column)
+        if old is not None and '<f' in old:
+            raise PatchError(f"Cell {get_column_letter(column)}{row} holds a formula")
+        style = STYLE_PATTERN.search(old.split('>', 1)[0]) if old is not None else None
+        patched[column] = cell_xml(f"{get_column_letter(column)}{row}", value, style.group(1) if style else None)
+    body = ''.join(patched[column] for column in sorted(patched))
+    return row_xml[:head_end] + body + '</row>'
+
+
+def patch_cells(file_path, sheet_name, cells, expected=None):
+    """
+    Rewrites only the given cells of a sheet inside the xlsx archive; every other part is copied unchanged.
+
+    Args:
+        file_path (str): The xlsx workbook, replaced once the patched copy is complete.
+        sheet_name (str): Sheet holding the cells.
+        cells (dict): {(row, column): value}, 1-based as in Excel.
+        expected (dict, optional): {(row, column): value} checked against the sheet before anything is written,
+            so that rows located by position are known to still be the right ones; see same_value.
+
+    Raises:
+        StaleRowError: A cell does not hold its expected value; nothing was written.
+        PatchError: The rows or cells cannot be patched safely; nothing was written.
+    """
+    rows = {}
+    for (row, column), value in cells.items():
+        rows.setdefault(row, {})[column] = value
+
+    with zipfile.ZipFile(file_path) as archive:
+        part = sheet_part(archive, sheet_name)
+        sheet_xml = archive.read(part).decode('utf-8')
+
+        if expected:
+            strings = shared_strings(archive)
+            for (row, column), value in expected.items():
+                try:
+                    start, end = find_row(sheet_xml, row)
+                except PatchError:
+                    start = end = 0
+                cell = next((match.group(0) for match in CELL_PATTERN.finditer(sheet_xml, start, end)
+                             if column_index_from_string(match.group(1)) == column), None)
+                found = cell_value(cell, strings) if cell is not None else None
+                if not same_value(found, value):
+                    raise StaleRowError(f"Cell {get_column_letter(column)}{row} holds {found!r} instead of {value!r}")
+
+        # Patch from the bottom up so the spans found for the remaining rows stay valid.
+        for row in sorted(rows, reverse=True):
+            start, end = find_row(sheet_xml, row)
+            sheet_xml = sheet_xml[:start] + patch_row(sheet_xml[start:end], row, rows[row]) + sheet_xml[end:]
+
+        directory = os.path.dirname(os.path.abspath(file_path))
+        handle, tmp_file = tempfile.mkstemp(suffix='.xlsx', dir=directory)
+        os.close(handle)
+        try:
+            with zipfile.ZipFile(tmp_file, 'w') as patched:
+                for info in archive.infolist():
+                    data = sheet_xml.encode('utf-8') if info.filename == part else archive.read(info)
+                    patched.writestr(info, data)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+    os.replace(tmp_file, file_path)